@@ -0,0 +1,301 @@
+"""
+Benchmarks of the ray tracer hot paths.
+
+Microbenchmarks time Vector arithmetic, the intersection routines and
+compute_lighting; macrobenchmarks time full frames of the shipped scenes and
+of generated scenes; parser benchmarks time parse_scene_file on generated
+scene files. Results are printed (or written) as JSON so that runs
+can be compared across releases.
+
+    python3 benchmark.py --output bench.json
+    python3 benchmark.py --macro-only --sizes 10,1000 --width 200 --height 200
+    python3 benchmark.py --parse-only --parse-sizes 200000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import raytracing_FINAL as rt
+
+BENCH_VERSION = 1
+
+SHIPPED_SCENES = {
+    "sphere": rt.create_scene,
+    "triangle": rt.create_triangle_scene,
+    "move": rt.create_scene_moove,
+}
+
+
+def time_call(fn, repeat=5):
+    """Best time per call of fn(), in seconds"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def micro_entry(name, fn, repeat):
+    per_call = time_call(fn, repeat)
+    return {
+        "name": name,
+        "ns_per_call": per_call * 1e9,
+        "calls_per_sec": 1.0 / per_call,
+    }
+
+
+def run_micro(repeat=5):
+    """Microbenchmarks of Vector, the intersection routines and compute_lighting"""
+    V = rt.Vector
+    a = V(0.3, -1.2, 2.5)
+    b = V(-0.7, 0.4, 1.1)
+
+    scene = rt.create_scene()
+    sphere = scene.Spheres[0]
+    plane = scene.Planes[0]
+    triangle = rt.Triangle(V(-1, -1, 4), V(1, -1, 4), V(0, 1, 4), (255, 200, 50))
+
+    O = V(0, 0, 0)
+    D_hit = V(0.0, -0.3, 1.0).normalize()
+    D_miss = V(0.9, 0.9, 0.2).normalize()
+    D_forward = V(0, 0, 1)
+
+    # Point and normal on the red sphere, seen from the camera
+    t = min(rt.intersect_ray_sphere(O, D_hit, sphere))
+    P = O + D_hit * t
+    N = (P - sphere.center).normalize()
+    V_view = D_hit * (-1)
+
+    cases = [
+        ("vector.add", lambda: a + b),
+        ("vector.sub", lambda: a - b),
+        ("vector.mul", lambda: a * 0.5),
+        ("vector.dot", lambda: a.dot(b)),
+        ("vector.cross", lambda: a.cross(b)),
+        ("vector.normalize", lambda: a.normalize()),
+        ("intersect_ray_sphere.hit", lambda: rt.intersect_ray_sphere(O, D_hit, sphere)),
+        ("intersect_ray_sphere.miss", lambda: rt.intersect_ray_sphere(O, D_miss, sphere)),
+        ("intersect_ray_plane", lambda: rt.intersect_ray_plane(O, D_hit, plane)),
+        ("intersect_ray_triangle.hit", lambda: rt.intersect_ray_triangle(O, D_forward, triangle)),
+        ("intersect_ray_triangle.miss", lambda: rt.intersect_ray_triangle(O, D_miss, triangle)),
+        ("compute_lighting", lambda: rt.compute_lighting(P, N, V_view, sphere.specular, scene, sphere)),
+    ]
+    return [micro_entry(name, fn, repeat) for name, fn in cases]
+
+
+def room_planes():
+    V = rt.Vector
+    return [
+        rt.Plane(V(0, -2, 0), V(0, 1, 0), (200, 200, 200)),
+        rt.Plane(V(0, 0, 10), V(0, 0, -1), (180, 190, 200)),
+        rt.Plane(V(-5, 0, 0), V(1, 0, 0), (100, 50, 200)),
+        rt.Plane(V(5, 0, 0), V(-1, 0, 0), (200, 0, 0)),
+        rt.Plane(V(0, 5, 0), V(0, -1, 0), (200, 200, 200)),
+    ]
+
+
+def room_lights():
+    V = rt.Vector
+    return [
+        rt.Light("ambient", 0.2),
+        rt.Light("point", 0.6, position=V(2, 1, 0)),
+        rt.Light("directional", 0.2, direction=V(1, 4, 4)),
+    ]
+
+
+def generate_scene(kind, count, seed=0):
+    """
+    Random scene with count spheres or triangles in front of the camera, inside the
+    usual room. Primitive size shrinks with count so the scene keeps a similar coverage.
+    """
+    rng = random.Random(seed)
+    V = rt.Vector
+    size = 1.5 / count ** (1 / 3)
+
+    def random_point():
+        return V(rng.uniform(-3, 3), rng.uniform(-1.5, 3), rng.uniform(3, 9))
+
+    def random_color():
+        return (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+
+    spheres, triangles = [], []
+    for _ in range(count):
+        c = random_point()
+        if kind == "spheres":
+            spheres.append(rt.Sphere(c, size * rng.uniform(0.3, 0.6), random_color(),
+                                     rng.choice([-1, 10, 500]), rng.choice([0.0, 0.0, 0.2])))
+        else:
+            def corner():
+                return c + V(rng.uniform(-size, size), rng.uniform(-size, size), rng.uniform(-size, size))
+            triangles.append(rt.Triangle(corner(), corner(), corner(), random_color(),
+                                         rng.choice([-1, 10, 500]), rng.choice([0.0, 0.0, 0.2])))
+
+    return rt.Scene(spheres, room_planes(), room_lights(), triangles=triangles)
+
+
+def render_function(engine):
+    if engine == "numpy":
+        return rt.render_image_numpy
+    return rt.render_image
+
+
+def count_vector_allocations(render, scene, width, height):
+    """Number of Vector objects created while rendering one frame (untimed pass)"""
+    original_init = rt.Vector.__init__
+    count = [0]
+
+    def counting_init(self, *args, **kwargs):
+        count[0] += 1
+        original_init(self, *args, **kwargs)
+
+    rt.Vector.__init__ = counting_init
+    try:
+        render(scene, width, height)
+    finally:
+        rt.Vector.__init__ = original_init
+    return count[0]
+
+
+def macro_entry(name, scene, width, height, engine, setup_seconds=0.0):
+    render = render_function(engine)
+    rt.reset_render_stats()
+    start = time.perf_counter()
+    render(scene, width, height)
+    seconds = time.perf_counter() - start
+
+    rays = rt.RENDER_STATS["rays"] + rt.RENDER_STATS["shadow_rays"]
+    stats = dict(rt.RENDER_STATS)
+    allocations = count_vector_allocations(render, scene, width, height)
+    return {
+        "name": name,
+        "engine": engine,
+        "width": width,
+        "height": height,
+        "primitives": len(scene.Spheres) + len(scene.Planes) + len(scene.Triangles),
+        "setup_seconds": setup_seconds,
+        "seconds": seconds,
+        "pixels_per_sec": width * height / seconds,
+        "rays_per_sec": rays / seconds,
+        "vector_allocations_per_ray": allocations / rays if rays else 0.0,
+        "stats": stats,
+    }
+
+
+def run_macro(width, height, engine, sizes, kinds):
+    results = []
+    for name, create in SHIPPED_SCENES.items():
+        start = time.perf_counter()
+        scene = create()
+        setup = time.perf_counter() - start
+        print(f"[macro] {name} ({width}x{height}, {engine})", file=sys.stderr)
+        results.append(macro_entry(name, scene, width, height, engine, setup))
+
+    for kind in kinds:
+        for count in sizes:
+            start = time.perf_counter()
+            scene = generate_scene(kind, count)
+            setup = time.perf_counter() - start
+            name = f"generated-{kind}-{count}"
+            print(f"[macro] {name} ({width}x{height}, {engine})", file=sys.stderr)
+            results.append(macro_entry(name, scene, width, height, engine, setup))
+    return results
+
+
+def write_scene_file(path, count, seed=0):
+    """Scene file with count sphere blocks in the book_shapes.txt layout, and an ambient light"""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for _ in range(count):
+            f.write("sphere {\n")
+            f.write(f"    center = ({rng.uniform(-3, 3):.3f}, {rng.uniform(-1.5, 3):.3f}, {rng.uniform(3, 9):.3f})\n")
+            f.write(f"    radius = {rng.uniform(0.05, 0.5):.3f}\n")
+            f.write(f"    color = ({rng.randrange(256)}, {rng.randrange(256)}, {rng.randrange(256)})  # Color\n")
+            f.write(f"    specular = {rng.choice([-1, 10, 500])}  # Shiny\n")
+            f.write(f"    reflective = {rng.choice([0.0, 0.2, 0.5])}  # Reflective\n")
+            f.write("}\n")
+        f.write("light {\n    type = ambient\n    intensity = 0.2\n}\n")
+
+
+def run_parse(sizes, repeat=3):
+    """Best time of parse_scene_file on generated scene files of each size"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            path = os.path.join(tmp, f"spheres-{count}.txt")
+            write_scene_file(path, count)
+            with open(path) as f:
+                lines = sum(1 for _ in f)
+            print(f"[parse] {count} spheres ({lines} lines)", file=sys.stderr)
+            seconds = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rt.parse_scene_file(path)
+                seconds = min(seconds, time.perf_counter() - start)
+            results.append({
+                "name": f"parse-spheres-{count}",
+                "lines": lines,
+                "bytes": os.path.getsize(path),
+                "seconds": seconds,
+                "lines_per_sec": lines / seconds,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du raytracer")
+    parser.add_argument("--output", help="Fichier JSON de sortie (défaut : sortie standard)")
+    parser.add_argument("--micro-only", action="store_true", help="Uniquement les microbenchmarks")
+    parser.add_argument("--macro-only", action="store_true", help="Uniquement les rendus complets")
+    parser.add_argument("--parse-only", action="store_true", help="Uniquement la lecture des fichiers de scène")
+    parser.add_argument("--width", type=int, default=100, help="Largeur des rendus complets (défaut: 100)")
+    parser.add_argument("--height", type=int, default=100, help="Hauteur des rendus complets (défaut: 100)")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python", help="Moteur de rendu")
+    parser.add_argument("--sizes", default="10,1000,100000",
+                        help="Nombres de primitives des scènes générées (défaut: 10,1000,100000)")
+    parser.add_argument("--kinds", default="triangles",
+                        help="Primitives des scènes générées : triangles, spheres (défaut: triangles)")
+    parser.add_argument("--parse-sizes", default="1000,200000",
+                        help="Nombres de sphères des fichiers de scène lus (défaut: 1000,200000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Répétitions des microbenchmarks (défaut: 5)")
+    args = parser.parse_args()
+
+    # The shipped scenes are loaded relative to the repository
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    report = {
+        "version": BENCH_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "micro": [],
+        "macro": [],
+        "parse": [],
+    }
+
+    only = args.micro_only or args.macro_only or args.parse_only
+    if args.micro_only or not only:
+        print("[micro] running microbenchmarks", file=sys.stderr)
+        report["micro"] = run_micro(args.repeat)
+    if args.macro_only or not only:
+        sizes = [int(n) for n in args.sizes.split(",") if n]
+        kinds = [k for k in args.kinds.split(",") if k]
+        report["macro"] = run_macro(args.width, args.height, args.engine, sizes, kinds)
+    if args.parse_only or not only:
+        report["parse"] = run_parse([int(n) for n in args.parse_sizes.split(",") if n])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results saved to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
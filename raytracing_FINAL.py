@@ -1,19 +1,37 @@
 import math
+import os
+from array import array
+import functools
+import hashlib
+import json
+import mmap
+import operator
 import re
+import struct
 import argparse
+import builtins
 import subprocess
 import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 INF = float('inf')
 BACKGROUND_COLOR = (0, 0, 0)
 
 CANVAS_WIDTH = 500
 CANVAS_HEIGHT = 500
-VIEWPORT_WIDTH = 2.0
 VIEWPORT_HEIGHT = 2.0
 VIEWPORT_DISTANCE = 1.0
 
 class Vector:
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x, y, z):
         self.x = x
         self.y = y
@@ -46,6 +64,21 @@ class Vector:
         if l == 0:
             return Vector(0, 0, 0)
         return Vector(self.x / l, self.y / l, self.z / l)
+
+    # Opérations fusionnées pour les boucles critiques : même résultat, sans vecteur intermédiaire
+
+    def madd(self, v, scalar):
+        """self + v * scalar"""
+        return Vector(self.x + v.x * scalar, self.y + v.y * scalar, self.z + v.z * scalar)
+
+    def normalize_in_place(self):
+        """Normalize this vector without allocating; returns self"""
+        l = math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        if l != 0:
+            self.x /= l
+            self.y /= l
+            self.z /= l
+        return self
     
     def __repr__(self):
         return f"Vector({self.x}, {self.y}, {self.z})"
@@ -59,6 +92,12 @@ class Sphere:
         self.specular = specular
         self.reflective = reflective
         self.texture = texture
+        self.precompute()
+
+    def precompute(self):
+        """Refresh the intersection record (center, squared radius); needed after moving the sphere"""
+        c = self.center
+        self.record = (c.x, c.y, c.z, self.radius * self.radius)
 
 class Plane:
     def __init__(self, point, normal, color, specular=100, reflective=0.0, texture=None):
@@ -68,6 +107,12 @@ class Plane:
         self.specular = specular
         self.reflective = reflective
         self.texture = texture
+        self.precompute()
+
+    def precompute(self):
+        """Refresh the intersection record (normal, point)"""
+        n, p = self.normal, self.point
+        self.record = (n.x, n.y, n.z, p.x, p.y, p.z)
 
 class Triangle:
     def __init__(self, v0, v1, v2, color, specular=100, reflective=0.0, texture=None):
@@ -79,6 +124,99 @@ class Triangle:
         self.reflective = reflective
         self.texture = texture
         self.normal = (v1 - v0).cross(v2 - v0).normalize()
+        self.precompute()
+
+    def precompute(self):
+        """Refresh the intersection record (v0, edge1 = v1 - v0, edge2 = v2 - v0)"""
+        v0, v1, v2 = self.v0, self.v1, self.v2
+        self.record = (
+            v0.x, v0.y, v0.z,
+            v1.x - v0.x, v1.y - v0.y, v1.z - v0.z,
+            v2.x - v0.x, v2.y - v0.y, v2.z - v0.z,
+        )
+
+class Mesh:
+    """
+    Indexed triangle mesh: vertex coordinates are stored once in a flat buffer
+    (x0, y0, z0, x1, ...) and faces as triples of indices into it.
+    """
+    def __init__(self, vertices, faces, color, specular=100, reflective=0.0, texture=None, source=None):
+        self.vertices = vertices
+        self.faces = faces
+        self.color = color
+        self.specular = specular
+        self.reflective = reflective
+        self.texture = texture
+        self.source = source    # fichier OBJ d'origine
+
+    def __reduce__(self):
+        # Les tampons chargés depuis le cache sont des memoryview sur un mmap : copiés en array
+        vertices, faces = array('d'), array('i')
+        vertices.frombytes(memoryview(self.vertices).cast('B'))
+        faces.frombytes(memoryview(self.faces).cast('B'))
+        return (Mesh, (vertices, faces, self.color, self.specular, self.reflective, self.texture, self.source))
+
+    def vertex(self, i):
+        v = self.vertices
+        return Vector(v[3 * i], v[3 * i + 1], v[3 * i + 2])
+
+    def triangles(self):
+        return [MeshTriangle(self, f) for f in range(len(self.faces) // 3)]
+
+class MeshTriangle:
+    """Face of a Mesh, usable wherever a Triangle is: vertices are read from the shared buffer"""
+    __slots__ = ("mesh", "face")
+
+    def __init__(self, mesh, face):
+        self.mesh = mesh
+        self.face = face
+
+    @property
+    def v0(self):
+        return self.mesh.vertex(self.mesh.faces[3 * self.face])
+
+    @property
+    def v1(self):
+        return self.mesh.vertex(self.mesh.faces[3 * self.face + 1])
+
+    @property
+    def v2(self):
+        return self.mesh.vertex(self.mesh.faces[3 * self.face + 2])
+
+    @property
+    def normal(self):
+        v0 = self.v0
+        return (self.v1 - v0).cross(self.v2 - v0).normalize()
+
+    @property
+    def record(self):
+        """Intersection record of Triangle, read from the shared buffers (nothing is stored per face)"""
+        v = self.mesh.vertices
+        k = 3 * self.face
+        a, b, c = self.mesh.faces[k:k + 3]
+        a, b, c = 3 * a, 3 * b, 3 * c
+        x0, y0, z0 = v[a], v[a + 1], v[a + 2]
+        return (
+            x0, y0, z0,
+            v[b] - x0, v[b + 1] - y0, v[b + 2] - z0,
+            v[c] - x0, v[c + 1] - y0, v[c + 2] - z0,
+        )
+
+    @property
+    def color(self):
+        return self.mesh.color
+
+    @property
+    def specular(self):
+        return self.mesh.specular
+
+    @property
+    def reflective(self):
+        return self.mesh.reflective
+
+    @property
+    def texture(self):
+        return self.mesh.texture
 
 class Light:
     def __init__(self, light_type, intensity, position=None, direction=None):
@@ -86,13 +224,18 @@ class Light:
         self.intensity = intensity
         self.position = position
         self.direction = direction
+        self.occluder = None  # dernier objet ayant bloqué un rayon d'ombre de cette lumière
 
 class Scene:
-    def __init__(self, spheres, planes, lights, triangles=None):
+    def __init__(self, spheres, planes, lights, triangles=None, bvh=None):
         self.Spheres = spheres
         self.Planes = planes
         self.Lights = lights
         self.Triangles = triangles if triangles else []
+        self.TriangleBVH = bvh  # BVH déjà construit sur ces triangles (cache), sinon construit ici
+        self.SphereGrid = None
+        self.NumpyArrays = None
+        compile_scene(self)
 
 class CheckerTexture:
     def __init__(self, color1, color2, scale=10):
@@ -106,12 +249,122 @@ class CheckerTexture:
         return self.color2
 
 
-def canvas_to_viewport(x, y):
-    """Convert canvas coordinates to viewport coordinates"""
-    vx = x * VIEWPORT_WIDTH / CANVAS_WIDTH
-    vy = y * VIEWPORT_HEIGHT / CANVAS_HEIGHT
-    vz = VIEWPORT_DISTANCE
-    return Vector(vx, vy, vz)
+class Framebuffer(bytearray):
+    """
+    RGB image stored as a flat bytearray: 3 bytes per pixel, rows from top to bottom.
+    Being a bytearray, it supports the buffer protocol: memoryview(fb), file.write(fb)
+    and np.frombuffer(fb, np.uint8) all use the pixels without copying them.
+    """
+
+    def __init__(self, width, height, data=None):
+        super().__init__(width * height * 3 if data is None else data)
+        if len(self) != width * height * 3:
+            raise ValueError(f"Framebuffer {width}x{height} needs {width * height * 3} bytes, got {len(self)}")
+        self.width = width
+        self.height = height
+
+    def __reduce_ex__(self, protocol):
+        return (Framebuffer, (self.width, self.height, bytes(self)))
+
+    @classmethod
+    def from_rows(cls, rows, width, height):
+        """Build a framebuffer from a list of rows of (r, g, b) tuples"""
+        return cls(width, height, bytes([c for row in rows for pixel in row for c in pixel]))
+
+    def get_pixel(self, x, y):
+        i = 3 * (y * self.width + x)
+        return self[i], self[i + 1], self[i + 2]
+
+    def set_pixel(self, x, y, color):
+        i = 3 * (y * self.width + x)
+        self[i:i + 3] = color
+
+    def row(self, y):
+        """Row y as a memoryview of 3 * width bytes (no copy)"""
+        stride = 3 * self.width
+        return memoryview(self)[y * stride:(y + 1) * stride]
+
+    def rows(self):
+        for y in range(self.height):
+            yield self.row(y)
+
+    def paste(self, tile, x0, y0):
+        """Copy the framebuffer tile into this one with its top-left corner at (x0, y0)"""
+        stride = 3 * self.width
+        tile_stride = 3 * tile.width
+        view = memoryview(tile)
+        for j in range(tile.height):
+            start = (y0 + j) * stride + 3 * x0
+            self[start:start + tile_stride] = view[j * tile_stride:(j + 1) * tile_stride]
+
+    def to_numpy(self):
+        """(height, width, 3) uint8 array sharing memory with the framebuffer"""
+        _require_numpy()
+        return np.frombuffer(self, dtype=np.uint8).reshape(self.height, self.width, 3)
+
+
+def compile_scene(scene):
+    """
+    Refresh the intersection records of the scene objects (sphere center and squared
+    radius, plane normal and point, triangle edges). Scene() compiles on creation;
+    call it again after moving objects, e.g. once per animation frame.
+    Mesh faces compute their record from the shared buffers and need no refresh.
+    The acceleration structures are built on the first call. Later calls update the
+    sphere grid (scenes of GRID_MIN_SPHERES spheres or more) in place, see
+    SphereGrid.update; the triangle BVH is kept, as no animation moves triangles:
+    set scene.TriangleBVH to None after moving them to have it rebuilt. The arrays
+    of the numpy engine (scene_arrays) are rebuilt on their next use.
+    """
+    for sphere in scene.Spheres:
+        sphere.precompute()
+    if scene.SphereGrid is not None and scene.SphereGrid.spheres is scene.Spheres:
+        scene.SphereGrid.update()
+    else:
+        scene.SphereGrid = build_sphere_grid(scene.Spheres)
+    for plane in scene.Planes:
+        plane.precompute()
+    for triangle in scene.Triangles:
+        if isinstance(triangle, Triangle):
+            triangle.precompute()
+    if scene.TriangleBVH is None:
+        scene.TriangleBVH = BVH(scene.Triangles)
+    scene.NumpyArrays = None
+
+
+class Camera:
+    """
+    Pixel to ray mapping of a frame of width x height pixels, seen from the origin.
+    fov is the vertical field of view in degrees; None keeps the viewport of height
+    VIEWPORT_HEIGHT at VIEWPORT_DISTANCE. Pixels are square: the horizontal extent of
+    the viewport follows the aspect ratio of the canvas.
+    The viewport coordinates of every column and row are computed once, here.
+    """
+
+    def __init__(self, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, fov=None):
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.distance = VIEWPORT_DISTANCE
+        if fov is None:
+            self.viewport_height = VIEWPORT_HEIGHT
+        else:
+            self.viewport_height = 2 * VIEWPORT_DISTANCE * math.tan(math.radians(fov) / 2)
+        self.viewport_width = self.viewport_height * width / height
+        # vx de la colonne i et vy de la ligne j (pixel 0, 0 en haut à gauche)
+        self.columns = [(-width // 2 + i) * self.viewport_width / width for i in range(width)]
+        self.rows = [(height // 2 - j) * self.viewport_height / height for j in range(height)]
+
+    def viewport(self, x, y):
+        """Point of the viewport at canvas coordinates (x, y), which may be fractional"""
+        return Vector(x * self.viewport_width / self.width, y * self.viewport_height / self.height, self.distance)
+
+    def direction(self, i, j):
+        """Normalized direction of the primary ray of pixel (i, j)"""
+        return Vector(self.columns[i], self.rows[j], self.distance).normalize_in_place()
+
+    def frustum(self, x0, x1, y0, y1):
+        """Frustum of the primary rays of the pixel columns x0..x1 and rows y0..y1"""
+        return Frustum(self.columns[x0], self.columns[x1 - 1], self.rows[y1 - 1], self.rows[y0], self.distance)
 
 
 def intersect_ray_sphere(O, D, sphere):
@@ -120,31 +373,36 @@ def intersect_ray_sphere(O, D, sphere):
     Returns tuple (t1, t2) of intersection parameters, or (INF, INF) if no intersection.
     O: Vector origin
     D: Vector direction
-    sphere: Sphere object
+    sphere: Sphere object (its precomputed record is used)
     """
-    r = sphere.radius
-    CO = O - sphere.center
+    cx, cy, cz, r2 = sphere.record
+    cox = O.x - cx
+    coy = O.y - cy
+    coz = O.z - cz
+    dx, dy, dz = D.x, D.y, D.z
     
-    a = D.dot(D)
-    b = 2 * CO.dot(D)
-    c = CO.dot(CO) - r * r
+    a = dx * dx + dy * dy + dz * dz
+    b = 2 * (cox * dx + coy * dy + coz * dz)
+    c = (cox * cox + coy * coy + coz * coz) - r2
     
     discriminant = b * b - 4 * a * c
     if discriminant < 0:
         return INF, INF
     
     sqrt_disc = math.sqrt(discriminant)
-    t1 = (-b + sqrt_disc) / (2 * a)
-    t2 = (-b - sqrt_disc) / (2 * a)
+    a2 = 2 * a
+    t1 = (-b + sqrt_disc) / a2
+    t2 = (-b - sqrt_disc) / a2
     
     return t1, t2
 
 def intersect_ray_plane(O, D, plane):
-    denom = plane.normal.dot(D)
+    nx, ny, nz, px, py, pz = plane.record
+    denom = nx * D.x + ny * D.y + nz * D.z
     if abs(denom) < 1e-6:
         return INF
 
-    t = (plane.point - O).dot(plane.normal) / denom
+    t = ((px - O.x) * nx + (py - O.y) * ny + (pz - O.z) * nz) / denom
     if t > 0:
         return t
     return INF
@@ -153,33 +411,918 @@ def intersect_ray_plane(O, D, plane):
 def intersect_ray_triangle(O, D, triangle):
     EPSILON = 1e-6
 
-    v0, v1, v2 = triangle.v0, triangle.v1, triangle.v2
-    edge1 = v1 - v0
-    edge2 = v2 - v0
+    v0x, v0y, v0z, e1x, e1y, e1z, e2x, e2y, e2z = triangle.record
+    dx, dy, dz = D.x, D.y, D.z
 
-    h = D.cross(edge2)
-    a = edge1.dot(h)
+    # h = D x edge2
+    hx = dy * e2z - dz * e2y
+    hy = dz * e2x - dx * e2z
+    hz = dx * e2y - dy * e2x
+    a = e1x * hx + e1y * hy + e1z * hz
     if -EPSILON < a < EPSILON:
         return INF
 
     f = 1.0 / a
-    s = O - v0
-    u = f * s.dot(h)
+    sx, sy, sz = O.x - v0x, O.y - v0y, O.z - v0z
+    u = f * (sx * hx + sy * hy + sz * hz)
     if u < 0.0 or u > 1.0:
         return INF
 
-    q = s.cross(edge1)
-    v = f * D.dot(q)
+    # q = s x edge1
+    qx = sy * e1z - sz * e1y
+    qy = sz * e1x - sx * e1z
+    qz = sx * e1y - sy * e1x
+    v = f * (dx * qx + dy * qy + dz * qz)
     if v < 0.0 or u + v > 1.0:
         return INF
 
-    t = f * edge2.dot(q)
+    t = f * (e2x * qx + e2y * qy + e2z * qz)
     if t > EPSILON:
         return t
 
     return INF
 
 
+BVH_LEAF_SIZE = 4
+BVH_BINS = 12
+BVH_EPSILON = 1e-6
+
+
+def _surface_area(b):
+    dx, dy, dz = b[3] - b[0], b[4] - b[1], b[5] - b[2]
+    return 2 * (dx * dy + dy * dz + dz * dx)
+
+
+def _merge_bounds(a, b):
+    return (
+        min(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]),
+        max(a[3], b[3]), max(a[4], b[4]), max(a[5], b[5]),
+    )
+
+
+def triangle_bounds(triangle):
+    """Axis-aligned bounding box (minx, miny, minz, maxx, maxy, maxz), slightly padded"""
+    v0, v1, v2 = triangle.v0, triangle.v1, triangle.v2
+    return (
+        min(v0.x, v1.x, v2.x) - BVH_EPSILON,
+        min(v0.y, v1.y, v2.y) - BVH_EPSILON,
+        min(v0.z, v1.z, v2.z) - BVH_EPSILON,
+        max(v0.x, v1.x, v2.x) + BVH_EPSILON,
+        max(v0.y, v1.y, v2.y) + BVH_EPSILON,
+        max(v0.z, v1.z, v2.z) + BVH_EPSILON,
+    )
+
+
+class BVH:
+    """
+    Bounding volume hierarchy over triangles, built with a binned SAH.
+    Nodes are stored flat as tuples (bounds, left, right, start, count, axis);
+    a node is a leaf when count > 0 and then covers triangles[start:start + count].
+    """
+
+    def __init__(self, triangles, leaf_size=BVH_LEAF_SIZE, bins=BVH_BINS):
+        self.leaf_size = leaf_size
+        self.bins = bins
+        self.nodes = []
+        self.triangles = []
+        if triangles:
+            self._build(list(triangles))
+
+    @classmethod
+    def from_arrays(cls, triangles, bounds, links, leaf_size=BVH_LEAF_SIZE, bins=BVH_BINS):
+        """
+        BVH read back from flat arrays, as written by the scene cache: triangles in leaf
+        order, 6 bounds and 5 links (left, right, start, count, axis) per node.
+        """
+        bvh = cls([], leaf_size, bins)
+        it = iter(bounds)
+        boxes = zip(it, it, it, it, it, it)
+        it = iter(links)
+        bvh.nodes = [(b,) + link for b, link in zip(boxes, zip(it, it, it, it, it))]
+        bvh.triangles = triangles
+        return bvh
+
+    def _build(self, triangles):
+        boxes = [triangle_bounds(t) for t in triangles]
+        # One list per coordinate so that min/max run over map() at C speed
+        lo = [[b[a] for b in boxes] for a in range(3)]
+        hi = [[b[a + 3] for b in boxes] for a in range(3)]
+        centroids = [[(l + h) * 0.5 for l, h in zip(lo[a], hi[a])] for a in range(3)]
+        self._lo, self._hi, self._centroids = lo, hi, centroids
+
+        order = list(range(len(triangles)))
+        nodes = self.nodes
+        nodes.append(None)
+        stack = [(0, 0, len(order))]
+
+        while stack:
+            node_index, start, end = stack.pop()
+            items = order[start:end]
+            node_bounds = self._bounds_of(items)
+
+            split = self._find_split(items, node_bounds) if len(items) > self.leaf_size else None
+            if split is None:
+                nodes[node_index] = (node_bounds, -1, -1, start, len(items), 0)
+                continue
+
+            axis, left_items, right_items = split
+            order[start:end] = left_items + right_items
+            mid = start + len(left_items)
+
+            left = len(nodes)
+            right = left + 1
+            nodes.append(None)
+            nodes.append(None)
+            nodes[node_index] = (node_bounds, left, right, -1, 0, axis)
+
+            stack.append((right, mid, end))
+            stack.append((left, start, mid))
+
+        self.triangles = [triangles[k] for k in order]
+        del self._lo, self._hi, self._centroids
+
+    def _bounds_of(self, items):
+        lo, hi = self._lo, self._hi
+        return (
+            min(map(lo[0].__getitem__, items)),
+            min(map(lo[1].__getitem__, items)),
+            min(map(lo[2].__getitem__, items)),
+            max(map(hi[0].__getitem__, items)),
+            max(map(hi[1].__getitem__, items)),
+            max(map(hi[2].__getitem__, items)),
+        )
+
+    def _find_split(self, items, node_bounds):
+        """Best binned-SAH split of items, or None when a leaf is cheaper"""
+        extents = []
+        for a in range(3):
+            values = list(map(self._centroids[a].__getitem__, items))
+            extents.append((max(values) - min(values), min(values), values))
+        axis = max(range(3), key=lambda a: extents[a][0])
+        extent, cmin, values = extents[axis]
+        if extent <= 0:
+            return None
+
+        nb = self.bins
+        scale = nb / extent
+        groups = [[] for _ in range(nb)]
+        for k, c in zip(items, values):
+            groups[min(nb - 1, int((c - cmin) * scale))].append(k)
+        bin_bounds = [self._bounds_of(g) if g else None for g in groups]
+
+        # Sweep from the right to get the SAH term of every right-hand side
+        right_cost = [0.0] * nb
+        acc, count = None, 0
+        for b in range(nb - 1, 0, -1):
+            if bin_bounds[b] is not None:
+                acc = bin_bounds[b] if acc is None else _merge_bounds(acc, bin_bounds[b])
+            count += len(groups[b])
+            right_cost[b] = _surface_area(acc) * count if acc is not None else 0.0
+
+        best_cost, best_split = INF, None
+        acc, count = None, 0
+        for b in range(nb - 1):
+            if bin_bounds[b] is not None:
+                acc = bin_bounds[b] if acc is None else _merge_bounds(acc, bin_bounds[b])
+            count += len(groups[b])
+            if count == 0 or count == len(items):
+                continue
+            cost = _surface_area(acc) * count + right_cost[b + 1]
+            if cost < best_cost:
+                best_cost, best_split = cost, b
+
+        if best_split is None:
+            return None
+        leaf_cost = _surface_area(node_bounds) * len(items)
+        if best_cost >= leaf_cost and len(items) <= 4 * self.leaf_size:
+            return None
+
+        left_items = [k for g in groups[:best_split + 1] for k in g]
+        right_items = [k for g in groups[best_split + 1:] for k in g]
+        return axis, left_items, right_items
+
+    def _traverse(self, O, D, t_min, t_max, visible=None):
+        """
+        Yield the leaves whose box is crossed by the ray within [t_min, t_max], near child first.
+        If visible is given, nodes outside this set of node indices are skipped untested.
+        """
+        if not self.nodes:
+            return
+        ox, oy, oz = O.x, O.y, O.z
+        ix = 1.0 / D.x if D.x != 0 else 1e300
+        iy = 1.0 / D.y if D.y != 0 else 1e300
+        iz = 1.0 / D.z if D.z != 0 else 1e300
+        direction = (D.x, D.y, D.z)
+        nodes = self.nodes
+
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            if visible is not None and index not in visible:
+                continue
+            b, left, right, start, count, axis = nodes[index]
+
+            t1 = (b[0] - ox) * ix
+            t2 = (b[3] - ox) * ix
+            near, far = (t1, t2) if t1 < t2 else (t2, t1)
+            t1 = (b[1] - oy) * iy
+            t2 = (b[4] - oy) * iy
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > near:
+                near = t1
+            if t2 < far:
+                far = t2
+            t1 = (b[2] - oz) * iz
+            t2 = (b[5] - oz) * iz
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > near:
+                near = t1
+            if t2 < far:
+                far = t2
+
+            if near > far or far < t_min or near > t_max[0]:
+                continue
+
+            if count:
+                yield start, count
+            elif direction[axis] > 0:
+                stack.append(right)
+                stack.append(left)
+            else:
+                stack.append(left)
+                stack.append(right)
+
+    def closest_hit(self, O, D, t_min, t_max, visible=None):
+        """Closest triangle with t_min <= t <= t_max: returns (t, triangle) or (INF, None)"""
+        closest_t, closest = INF, None
+        bound = [t_max]
+        triangles = self.triangles
+        for start, count in self._traverse(O, D, t_min, bound, visible):
+            for triangle in triangles[start:start + count]:
+                t = intersect_ray_triangle(O, D, triangle)
+                if t_min <= t <= bound[0] and t < closest_t:
+                    closest_t, closest = t, triangle
+                    bound[0] = t
+        return closest_t, closest
+
+    def any_hit(self, O, D, t_min, t_max, ignore=None):
+        """
+        First triangle found with t_min < t < t_max (other than ignore), or None.
+        Used for shadow rays: triangle tests are counted in RENDER_STATS.
+        """
+        triangles = self.triangles
+        for start, count in self._traverse(O, D, t_min, [t_max]):
+            for triangle in triangles[start:start + count]:
+                if triangle is ignore:
+                    continue
+                RENDER_STATS["shadow_tests"] += 1
+                t = intersect_ray_triangle(O, D, triangle)
+                if t_min < t < t_max:
+                    return triangle
+        return None
+
+    def visible_nodes(self, frustum):
+        """Indices of the nodes whose box intersects the frustum (children of culled nodes excluded)"""
+        visible = set()
+        stack = [0] if self.nodes else []
+        while stack:
+            index = stack.pop()
+            b, left, right, start, count, axis = self.nodes[index]
+            if frustum.sees_box(b):
+                visible.add(index)
+                if not count:
+                    stack.append(left)
+                    stack.append(right)
+        return visible
+
+
+GRID_MIN_SPHERES = 32
+GRID_DENSITY = 2.0
+GRID_MAX_RESOLUTION = 128
+GRID_MAX_CELLS_PER_SPHERE = 64
+GRID_EPSILON = 1e-9
+GRID_REBUILD_THRESHOLD = 1.2
+
+
+class SphereGrid:
+    """
+    Uniform grid over the spheres of a scene, traversed with a 3D-DDA.
+    Each cell lists the indices of the spheres whose (padded) bounding box overlaps
+    it, in scene order. Spheres covering too many cells (e.g. a huge ground sphere)
+    are kept in a linear list tested by every ray.
+    Ties between spheres hit at the same t go to the first in scene order, as in
+    the linear loop of closest_intersection, so the rendered image is unchanged.
+    When the spheres move, update() re-bins only those that changed cells.
+    """
+
+    def __init__(self, spheres, density=GRID_DENSITY, max_resolution=GRID_MAX_RESOLUTION):
+        self.spheres = spheres
+        self.density = density
+        self.max_resolution = max_resolution
+        self.rebuild()
+
+    def rebuild(self):
+        """Choose the bounds and resolution of the grid from the spheres and bin them all"""
+        spheres = self.spheres
+        n = len(spheres)
+        self.large = []
+        self.cells = []
+        self.resolution = (0, 0, 0)
+        # Cellules (i0, i1, j0, j1, l0, l1) de chaque sphère, None si elle est dans large
+        self.ranges = [None] * n
+        self.entries = self.occupied = 0
+        self.limit = INF
+        self.build_cost = 0.0
+        if n == 0:
+            return
+
+        # Les très grosses sphères (sol, ciel...) fausseraient les bornes de la grille
+        cxs = [s.center.x for s in spheres]
+        cys = [s.center.y for s in spheres]
+        czs = [s.center.z for s in spheres]
+        extent = max(max(cxs) - min(cxs), max(cys) - min(cys), max(czs) - min(czs))
+        radii = sorted(s.radius for s in spheres)
+        limit = max(extent * 0.25, 4 * radii[n // 2])
+        small = [k for k in range(n) if spheres[k].radius <= limit]
+        self.large = [k for k in range(n) if spheres[k].radius > limit]
+        self.limit = limit
+        if not small:
+            return
+
+        pad = GRID_EPSILON * (1 + extent)
+        boxes = []
+        for k in small:
+            c, r = spheres[k].center, spheres[k].radius + pad
+            boxes.append((k, c.x - r, c.y - r, c.z - r, c.x + r, c.y + r, c.z + r))
+        lo = [min(b[a] for b in boxes) for a in (1, 2, 3)]
+        hi = [max(b[a] for b in boxes) for a in (4, 5, 6)]
+        size = [max(h - l, pad) for l, h in zip(lo, hi)]
+
+        # Environ density cellules par sphère, réparties selon les proportions de la boîte
+        volume = size[0] * size[1] * size[2]
+        scale = (self.density * len(small) / volume) ** (1 / 3)
+        res = [max(1, min(self.max_resolution, int(s * scale))) for s in size]
+        nx, ny, nz = res
+        # Marge d'un rayon autour des sphères : update() garde dans la grille celles qui
+        # se sont peu déplacées, sans changer la résolution
+        margin = max(spheres[k].radius for k in small)
+        lo = [l - margin for l in lo]
+        size = [s + 2 * margin for s in size]
+        cell = [size[a] / res[a] for a in range(3)]
+        self.bounds = (lo[0], lo[1], lo[2], lo[0] + size[0], lo[1] + size[1], lo[2] + size[2])
+        self.resolution = (nx, ny, nz)
+        self.cell_size = tuple(cell)
+        self.pad = pad
+
+        cells = [None] * (nx * ny * nz)
+        large = set(self.large)
+        for k, x0, y0, z0, x1, y1, z1 in boxes:
+            i0 = min(nx - 1, int((x0 - lo[0]) / cell[0]))
+            i1 = min(nx - 1, int((x1 - lo[0]) / cell[0]))
+            j0 = min(ny - 1, int((y0 - lo[1]) / cell[1]))
+            j1 = min(ny - 1, int((y1 - lo[1]) / cell[1]))
+            l0 = min(nz - 1, int((z0 - lo[2]) / cell[2]))
+            l1 = min(nz - 1, int((z1 - lo[2]) / cell[2]))
+            if (i1 - i0 + 1) * (j1 - j0 + 1) * (l1 - l0 + 1) > GRID_MAX_CELLS_PER_SPHERE:
+                large.add(k)
+                continue
+            self.ranges[k] = (i0, i1, j0, j1, l0, l1)
+            for l in range(l0, l1 + 1):
+                for j in range(j0, j1 + 1):
+                    base = (l * ny + j) * nx
+                    for i in range(i0, i1 + 1):
+                        if cells[base + i] is None:
+                            cells[base + i] = [k]
+                            self.occupied += 1
+                        else:
+                            cells[base + i].append(k)
+                        self.entries += 1
+        self.large = sorted(large)
+        self.cells = cells
+        self.build_cost = self.cost()
+
+    def cost(self):
+        """
+        Quality of the grid, as a rough count of spheres tested by a ray crossing it:
+        the linear list, plus the mean number of spheres in a non-empty cell times the
+        number of cells along an axis.
+        """
+        return len(self.large) + sum(self.resolution) / 3 * self.entries / max(self.occupied, 1)
+
+    def _move(self, k, old, new):
+        """Take sphere k out of the cells of range old and put it in those of range new"""
+        nx, ny = self.resolution[0], self.resolution[1]
+        cells = self.cells
+        if old is not None:
+            i0, i1, j0, j1, l0, l1 = old
+            for l in range(l0, l1 + 1):
+                for j in range(j0, j1 + 1):
+                    base = (l * ny + j) * nx
+                    for i in range(i0, i1 + 1):
+                        items = cells[base + i]
+                        items.remove(k)
+                        if not items:
+                            cells[base + i] = None
+                            self.occupied -= 1
+            self.entries -= (i1 - i0 + 1) * (j1 - j0 + 1) * (l1 - l0 + 1)
+        if new is not None:
+            i0, i1, j0, j1, l0, l1 = new
+            for l in range(l0, l1 + 1):
+                for j in range(j0, j1 + 1):
+                    base = (l * ny + j) * nx
+                    for i in range(i0, i1 + 1):
+                        items = cells[base + i]
+                        if items is None:
+                            cells[base + i] = [k]
+                            self.occupied += 1
+                        else:
+                            # Les cellules restent dans l'ordre de la scène, comme après rebuild()
+                            items.append(k)
+                            items.sort()
+            self.entries += (i1 - i0 + 1) * (j1 - j0 + 1) * (l1 - l0 + 1)
+
+    def update(self, threshold=GRID_REBUILD_THRESHOLD):
+        """
+        Follow spheres that moved, keeping the bounds and resolution of the grid: only
+        the spheres whose range of cells changed are re-binned, and those that left the
+        bounds join the linear list. The grid is rebuilt instead when the number of
+        spheres changed or cost() has grown past threshold times its value after the
+        last rebuild. Returns "update" or "rebuild".
+        This only pays off for small motions: when most spheres change cells every
+        frame, re-binning them costs as much as a rebuild.
+        """
+        spheres, ranges = self.spheres, self.ranges
+        if len(spheres) != len(ranges) or not self.cells:
+            self.rebuild()
+            return "rebuild"
+
+        x_min, y_min, z_min, x_max, y_max, z_max = self.bounds
+        nx, ny, nz = self.resolution
+        cx, cy, cz = self.cell_size
+        pad, limit = self.pad, self.limit
+        max_cost = self.build_cost * threshold
+        large = set(self.large)
+        for k, sphere in enumerate(spheres):
+            c, radius = sphere.center, sphere.radius
+            r = radius + pad
+            x0, x1, y0, y1, z0, z1 = c.x - r, c.x + r, c.y - r, c.y + r, c.z - r, c.z + r
+            new = None
+            # La sphère doit rester entière dans la grille : les rayons n'y sont suivis qu'à l'intérieur
+            if radius <= limit and x_min <= c.x - radius and c.x + radius <= x_max \
+                    and y_min <= c.y - radius and c.y + radius <= y_max \
+                    and z_min <= c.z - radius and c.z + radius <= z_max:
+                i0 = int((x0 - x_min) / cx)
+                i1 = min(nx - 1, int((x1 - x_min) / cx))
+                j0 = int((y0 - y_min) / cy)
+                j1 = min(ny - 1, int((y1 - y_min) / cy))
+                l0 = int((z0 - z_min) / cz)
+                l1 = min(nz - 1, int((z1 - z_min) / cz))
+                if (i1 - i0 + 1) * (j1 - j0 + 1) * (l1 - l0 + 1) <= GRID_MAX_CELLS_PER_SPHERE:
+                    new = (i0, i1, j0, j1, l0, l1)
+            old = ranges[k]
+            if new == old:
+                continue
+            self._move(k, old, new)
+            ranges[k] = new
+            if new is None:
+                large.add(k)
+                # cost() ne peut que dépasser le seuil : inutile de finir le tri des sphères
+                if len(large) > max_cost:
+                    self.rebuild()
+                    return "rebuild"
+            elif old is None:
+                large.discard(k)
+        self.large = sorted(large)
+
+        if self.cost() > max_cost:
+            self.rebuild()
+            return "rebuild"
+        return "update"
+
+    def _cells(self, O, D, t_min, t_max):
+        """
+        Yield (sphere indices, t at which the ray leaves the cell) for the non-empty
+        cells crossed by the ray within [t_min, t_max], from near to far.
+        """
+        if not self.cells:
+            return
+        b = self.bounds
+        ox, oy, oz = O.x, O.y, O.z
+        dx, dy, dz = D.x, D.y, D.z
+
+        # Entrée et sortie de la boîte de la grille (slabs)
+        t0, t1 = t_min, t_max
+        for o, d, lo, hi in ((ox, dx, b[0], b[3]), (oy, dy, b[1], b[4]), (oz, dz, b[2], b[5])):
+            if d == 0:
+                if o < lo or o > hi:
+                    return
+                continue
+            ta = (lo - o) / d
+            tb = (hi - o) / d
+            if ta > tb:
+                ta, tb = tb, ta
+            if ta > t0:
+                t0 = ta
+            if tb < t1:
+                t1 = tb
+        if t0 > t1:
+            return
+
+        nx, ny, nz = self.resolution
+        cx, cy, cz = self.cell_size
+        ix = min(nx - 1, max(0, int((ox + dx * t0 - b[0]) / cx)))
+        iy = min(ny - 1, max(0, int((oy + dy * t0 - b[1]) / cy)))
+        iz = min(nz - 1, max(0, int((oz + dz * t0 - b[2]) / cz)))
+
+        def axis_setup(o, d, index, lo, size):
+            if d > 0:
+                return 1, (lo + (index + 1) * size - o) / d, size / d
+            if d < 0:
+                return -1, (lo + index * size - o) / d, -size / d
+            return 0, INF, INF
+
+        sx, tx, ddx = axis_setup(ox, dx, ix, b[0], cx)
+        sy, ty, ddy = axis_setup(oy, dy, iy, b[1], cy)
+        sz, tz, ddz = axis_setup(oz, dz, iz, b[2], cz)
+        cells = self.cells
+
+        while True:
+            exit_t = min(tx, ty, tz)
+            items = cells[(iz * ny + iy) * nx + ix]
+            if items is not None:
+                yield items, exit_t
+            if exit_t > t1:
+                return
+            if exit_t == tx:
+                ix += sx
+                if not 0 <= ix < nx:
+                    return
+                tx += ddx
+            elif exit_t == ty:
+                iy += sy
+                if not 0 <= iy < ny:
+                    return
+                ty += ddy
+            else:
+                iz += sz
+                if not 0 <= iz < nz:
+                    return
+                tz += ddz
+
+    def closest_hit(self, O, D, t_min, t_max):
+        """Closest sphere with t_min <= t <= t_max: returns (t, sphere) or (INF, None)"""
+        spheres = self.spheres
+        best_t, best = INF, -1
+        for k in self.large:
+            t1, t2 = intersect_ray_sphere(O, D, spheres[k])
+            for t in (t1, t2):
+                if t_min <= t <= t_max and (t < best_t or t == best_t and k < best):
+                    best_t, best = t, k
+
+        tested = set()
+        for items, exit_t in self._cells(O, D, t_min, t_max):
+            for k in items:
+                if k in tested:
+                    continue
+                tested.add(k)
+                t1, t2 = intersect_ray_sphere(O, D, spheres[k])
+                for t in (t1, t2):
+                    if t_min <= t <= t_max and (t < best_t or t == best_t and k < best):
+                        best_t, best = t, k
+            # Les sphères des cellules suivantes ne peuvent être touchées qu'au-delà de exit_t
+            if best_t <= exit_t:
+                break
+
+        return (best_t, spheres[best]) if best >= 0 else (INF, None)
+
+    def any_hit(self, O, D, t_min, t_max, ignore=()):
+        """A sphere not in ignore with t_min < t < t_max (as is_shadowed), or None; counts shadow_tests"""
+        spheres = self.spheres
+        for k in self.large:
+            sphere = spheres[k]
+            if sphere in ignore:
+                continue
+            RENDER_STATS["shadow_tests"] += 1
+            t1, t2 = intersect_ray_sphere(O, D, sphere)
+            if t_min < t1 < t_max or t_min < t2 < t_max:
+                return sphere
+
+        tested = set()
+        for items, exit_t in self._cells(O, D, t_min, t_max):
+            for k in items:
+                if k in tested:
+                    continue
+                tested.add(k)
+                sphere = spheres[k]
+                if sphere in ignore:
+                    continue
+                RENDER_STATS["shadow_tests"] += 1
+                t1, t2 = intersect_ray_sphere(O, D, sphere)
+                if t_min < t1 < t_max or t_min < t2 < t_max:
+                    return sphere
+        return None
+
+
+def build_sphere_grid(spheres, min_spheres=GRID_MIN_SPHERES):
+    """SphereGrid of the spheres, or None when there are too few for a grid to pay off"""
+    return SphereGrid(spheres) if len(spheres) >= min_spheres else None
+
+
+PACKET_SIZE = 8
+FRUSTUM_EPSILON = 1e-6
+
+
+class Frustum:
+    """
+    Pyramid from the camera through a block of canvas pixels, containing all their
+    primary rays. An object outside it cannot be hit by any ray of the block.
+    The block spans the viewport coordinates [vx_min, vx_max] x [vy_min, vy_max].
+    """
+
+    def __init__(self, vx_min, vx_max, vy_min, vy_max, distance=VIEWPORT_DISTANCE):
+        # Pentes extrêmes vx / vz et vy / vz des rayons du bloc
+        ax0 = vx_min / distance
+        ax1 = vx_max / distance
+        ay0 = vy_min / distance
+        ay1 = vy_max / distance
+        # Normales intérieures des quatre faces, qui passent toutes par l'origine
+        self.planes = [
+            Vector(1, 0, -ax0).normalize(),
+            Vector(-1, 0, ax1).normalize(),
+            Vector(0, 1, -ay0).normalize(),
+            Vector(0, -1, ay1).normalize(),
+        ]
+
+    def sees_sphere(self, sphere):
+        c, r = sphere.center, sphere.radius + FRUSTUM_EPSILON
+        for n in self.planes:
+            if n.x * c.x + n.y * c.y + n.z * c.z < -r:
+                return False
+        return True
+
+    def sees_box(self, b):
+        for n in self.planes:
+            # Coin de la boîte le plus avancé dans la direction de la normale
+            x = b[3] if n.x > 0 else b[0]
+            y = b[4] if n.y > 0 else b[1]
+            z = b[5] if n.z > 0 else b[2]
+            if n.x * x + n.y * y + n.z * z < -FRUSTUM_EPSILON:
+                return False
+        return True
+
+
+class BVHView:
+    """The nodes of a BVH visible through a frustum; closest_hit skips all the others"""
+
+    def __init__(self, bvh, frustum):
+        self.bvh = bvh
+        self.visible = bvh.visible_nodes(frustum)
+
+    def closest_hit(self, O, D, t_min, t_max):
+        return self.bvh.closest_hit(O, D, t_min, t_max, self.visible)
+
+
+class PacketScene:
+    """
+    The objects of a scene that the primary rays of one packet can hit, for
+    closest_intersection. Planes are unbounded and always kept; the order of the
+    objects is preserved, so the result of each ray is unchanged.
+    """
+
+    def __init__(self, scene, frustum):
+        self.Planes = scene.Planes
+        # Avec une grille, le parcours ne visite déjà que les cellules traversées
+        self.SphereGrid = scene.SphereGrid
+        if self.SphereGrid is None:
+            self.Spheres = [s for s in scene.Spheres if frustum.sees_sphere(s)]
+        else:
+            self.Spheres = scene.Spheres
+        self.TriangleBVH = BVHView(scene.TriangleBVH, frustum)
+
+
+RENDER_STATS = {"rays": 0, "reflection_rays": 0, "shadow_rays": 0, "shadow_tests": 0, "shadow_cache_hits": 0,
+                "aa_pixels": 0}
+
+
+def reset_render_stats():
+    for key in RENDER_STATS:
+        RENDER_STATS[key] = 0
+
+
+def add_render_stats(stats):
+    """Accumulate counters coming from a worker process"""
+    for key, value in stats.items():
+        RENDER_STATS[key] += value
+
+
+def report_render_stats():
+    print(f"Rays: {RENDER_STATS['rays']} ({RENDER_STATS['reflection_rays']} reflected), "
+          f"shadow rays: {RENDER_STATS['shadow_rays']}, "
+          f"intersection tests: {RENDER_STATS['shadow_tests']}, "
+          f"occluder cache hits: {RENDER_STATS['shadow_cache_hits']}"
+          + (f", antialiased pixels: {RENDER_STATS['aa_pixels']}" if RENDER_STATS['aa_pixels'] else ""))
+
+
+# Phases mesurées par --profile : (nom, classe ou None pour une fonction du module, attribut, trace)
+# Les phases marquées trace apparaissent aussi une par une dans la trace Chrome.
+PROFILE_PHASES = (
+    ("tile", None, "render_tile", True),
+    ("tile", None, "render_tile_adaptive", True),
+    ("tile", None, "render_tile_numpy", True),
+    ("progressive", None, "render_progressive", True),
+    ("gbuffer", None, "build_gbuffer", True),
+    ("gbuffer_shade", None, "shade_gbuffer", True),
+    ("closest_hit", None, "closest_intersection", False),
+    ("surface", None, "surface_at", False),
+    ("shade", None, "shade", False),
+    ("lighting", None, "compute_lighting", False),
+    ("shadow", None, "is_shadowed", False),
+    ("specular", None, "pow", False),
+    ("texture", None, "sphere_uv", False),
+    ("texture", "CheckerTexture", "get_color", False),
+    ("reflection", None, "reflect_ray", False),
+    ("save", None, "save_ppm", True),
+    ("encode", "AnimationWriter", "add_frame", True),
+)
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the render loop (--profile).
+    install() replaces the functions of PROFILE_PHASES by timing wrappers and
+    uninstall() puts the originals back: without a profiler nothing is wrapped, so
+    rendering pays no cost at all. The specular phase wraps the pow builtin used by
+    compute_lighting through a module global that shadows it.
+    Calls are aggregated by call path (tile > shade > lighting > shadow...), with the
+    total and self time of each path; end_frame() prints them and starts a new frame.
+    The frames and the phases marked trace are kept as Chrome trace events
+    (chrome://tracing, Perfetto), written by save_trace().
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.frame_start = self.origin
+        self.stack = []
+        self.stats = {}
+        self.events = []
+        self.originals = []
+
+    def install(self):
+        namespace = globals()
+        for name, owner, attribute, trace in PROFILE_PHASES:
+            target = namespace[owner] if owner else namespace
+            if owner:
+                original = target.__dict__[attribute]
+                setattr(target, attribute, self._wrap(name, original, trace))
+            else:
+                original = target.get(attribute, getattr(builtins, attribute, None))
+                target[attribute] = self._wrap(name, original, trace)
+            self.originals.append((target, owner, attribute, original))
+
+    def uninstall(self):
+        for target, owner, attribute, original in reversed(self.originals):
+            if owner:
+                setattr(target, attribute, original)
+            elif getattr(builtins, attribute, None) is original:
+                del target[attribute]
+            else:
+                target[attribute] = original
+        self.originals = []
+
+    def _wrap(self, name, function, trace):
+        perf_counter = time.perf_counter
+        stack, stats, events = self.stack, self.stats, self.events
+        origin = self.origin
+        pid = os.getpid()
+
+        def wrapper(*args, **kwargs):
+            path = (stack[-1][0] if stack else ()) + (name,)
+            # [chemin, temps passé dans les phases appelées]
+            frame = [path, 0.0]
+            stack.append(frame)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1][1] += elapsed
+                entry = stats.get(path)
+                if entry is None:
+                    entry = stats[path] = [0, 0.0, 0.0]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - frame[1]
+                if trace:
+                    events.append({"name": name, "cat": "phase", "ph": "X", "pid": pid, "tid": 0,
+                                   "ts": (start - origin) * 1e6, "dur": elapsed * 1e6})
+
+        return functools.update_wrapper(wrapper, function)
+
+    def start_frame(self):
+        """Start timing a frame now (e.g. once the scene is loaded)"""
+        self.stats.clear()
+        self.frame_start = time.perf_counter()
+
+    def phase_totals(self):
+        """{phase: [calls, self time]} summed over all the call paths of the current frame"""
+        totals = {}
+        for path, (calls, total, own) in self.stats.items():
+            entry = totals.setdefault(path[-1], [0, 0.0])
+            entry[0] += calls
+            entry[1] += own
+        return totals
+
+    def report(self, label, seconds):
+        print(f"Profile of {label} ({seconds:.3f} s):")
+        print(f"  {'phase':<36}{'calls':>10}{'total (s)':>12}{'self (s)':>12}")
+
+        def children(parent):
+            paths = [p for p in self.stats if p[:-1] == parent]
+            return sorted(paths, key=lambda p: -self.stats[p][1])
+
+        def show(path):
+            calls, total, own = self.stats[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            print(f"  {name:<36}{calls:>10}{total:>12.3f}{own:>12.3f}")
+            for child in children(path):
+                show(child)
+
+        for path in children(()):
+            show(path)
+
+    def end_frame(self, label="frame"):
+        """Report the phases since the previous frame and record the frame in the trace"""
+        now = time.perf_counter()
+        seconds = now - self.frame_start
+        self.report(label, seconds)
+        totals = self.phase_totals()
+        pid = os.getpid()
+        ts = (self.frame_start - self.origin) * 1e6
+        self.events.append({"name": label, "cat": "frame", "ph": "X", "pid": pid, "tid": 1, "ts": ts,
+                            "dur": seconds * 1e6,
+                            "args": {name: {"calls": calls, "self_s": own} for name, (calls, own) in totals.items()}})
+        self.events.append({"name": "self time (s)", "ph": "C", "pid": pid, "ts": ts,
+                            "args": {name: own for name, (calls, own) in totals.items()}})
+        self.stats.clear()
+        self.frame_start = now
+
+    def save_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        print(f"Profile trace saved to {filename}")
+
+
+def _blocks_shadow_ray(P, L_dir, t_max, obj):
+    if isinstance(obj, Sphere):
+        t1, t2 = intersect_ray_sphere(P, L_dir, obj)
+        return 0.001 < t1 < t_max or 0.001 < t2 < t_max
+    t = intersect_ray_triangle(P, L_dir, obj)
+    return 0.001 < t < t_max
+
+
+def is_shadowed(P, L_dir, t_max, scene, light, current_object=None):
+    """
+    True if an object other than current_object lies on the shadow ray from P towards light.
+    The object that blocked the previous shadow ray of this light is tested first, since
+    neighbouring pixels are usually shadowed by the same object.
+    """
+    RENDER_STATS["shadow_rays"] += 1
+
+    occluder = light.occluder
+    if occluder is not None and occluder is not current_object:
+        RENDER_STATS["shadow_tests"] += 1
+        if _blocks_shadow_ray(P, L_dir, t_max, occluder):
+            RENDER_STATS["shadow_cache_hits"] += 1
+            return True
+
+    grid = scene.SphereGrid
+    if grid is None:
+        for sphere in scene.Spheres:
+            if sphere is current_object or sphere is occluder:
+                continue
+            RENDER_STATS["shadow_tests"] += 1
+            t1, t2 = intersect_ray_sphere(P, L_dir, sphere)
+            if 0.001 < t1 < t_max or 0.001 < t2 < t_max:
+                light.occluder = sphere
+                return True
+    else:
+        sphere = grid.any_hit(P, L_dir, 0.001, t_max, (current_object, occluder))
+        if sphere is not None:
+            light.occluder = sphere
+            return True
+
+    triangle = scene.TriangleBVH.any_hit(P, L_dir, 0.001, t_max, current_object)
+    if triangle is not None:
+        light.occluder = triangle
+        return True
+
+    return False
+
+
 def compute_lighting(P, N, V, s, scene, current_sphere=None):
     """
     Compute lighting at point P with normal N and view direction V.
@@ -201,31 +1344,12 @@ def compute_lighting(P, N, V, s, scene, current_sphere=None):
                 L = light.position - P
                 t_max = L.length()
             else:
-                L = light.direction.normalize() * (-1)
+                L = (light.direction * (-1)).normalize_in_place()
                 t_max = INF
 
             L_dir = L.normalize()
             
-            blocked = False
-
-            for sphere in scene.Spheres:
-                if sphere is current_sphere:
-                    continue
-                t1, t2 = intersect_ray_sphere(P, L_dir, sphere)
-                if 0.001 < t1 < t_max or 0.001 < t2 < t_max:
-                    blocked = True
-                    break
-
-            if not blocked:
-                for tri in scene.Triangles:
-                    if tri is current_sphere:
-                        continue
-                    t = intersect_ray_triangle(P, L_dir, tri)
-                    if 0.001 < t < t_max:
-                        blocked = True
-                        break
-
-            if blocked:
+            if is_shadowed(P, L_dir, t_max, scene, light, current_sphere):
                 continue
 
             n_dot_l = N.dot(L_dir)
@@ -233,18 +1357,22 @@ def compute_lighting(P, N, V, s, scene, current_sphere=None):
                 i += light.intensity * n_dot_l
             
             if light.type == "point":
-                distance = L.length()
+                distance = t_max
                 attenuation = 1 / (1 + 0.1 * distance + 0.01 * distance * distance)
                 i += light.intensity * n_dot_l * attenuation
             
             if s != -1 and s > 0:
-                N_dot_L = N.dot(L_dir)
-                if N_dot_L > 0:
-                    R = (N * (2 * N_dot_L)) - L_dir
-                    r_dot_v = R.dot(V)
+                if n_dot_l > 0:
+                    # R = N * (2 * n_dot_l) - L_dir, sans allouer de Vector
+                    k = 2 * n_dot_l
+                    rx = N.x * k - L_dir.x
+                    ry = N.y * k - L_dir.y
+                    rz = N.z * k - L_dir.z
+                    r_dot_v = rx * V.x + ry * V.y + rz * V.z
                     if r_dot_v > 0:
+                        R_length = math.sqrt(rx * rx + ry * ry + rz * rz)
                         i += light.intensity * pow(
-                            r_dot_v / (R.length() * V.length()),
+                            r_dot_v / (R_length * V.length()),
                             s
                         )
     
@@ -256,10 +1384,10 @@ def reflect_ray(R, N):
     return R - N * (2 * R.dot(N))
 
 
-def trace_ray(O, D, t_min, t_max, scene, depth=3):
+def closest_intersection(O, D, t_min, t_max, scene):
     """
-    Trace a ray and return the color at the nearest intersection.
-    Supports reflections up to `depth`.
+    Find the nearest object hit by the ray within [t_min, t_max].
+    Returns (t, object, object_type), object being None when nothing is hit.
     """
     closest_t = INF
     closest_object = None
@@ -272,242 +1400,791 @@ def trace_ray(O, D, t_min, t_max, scene, depth=3):
             closest_object = plane
             object_type = "plane"
 
-    for sphere in scene.Spheres:
-        t1, t2 = intersect_ray_sphere(O, D, sphere)
+    grid = scene.SphereGrid
+    if grid is None:
+        for sphere in scene.Spheres:
+            t1, t2 = intersect_ray_sphere(O, D, sphere)
 
-        if t_min <= t1 <= t_max and t1 < closest_t:
-            closest_t = t1
-            closest_object = sphere
-            object_type = "sphere"
+            if t_min <= t1 <= t_max and t1 < closest_t:
+                closest_t = t1
+                closest_object = sphere
+                object_type = "sphere"
 
-        if t_min <= t2 <= t_max and t2 < closest_t:
-            closest_t = t2
+            if t_min <= t2 <= t_max and t2 < closest_t:
+                closest_t = t2
+                closest_object = sphere
+                object_type = "sphere"
+    else:
+        t, sphere = grid.closest_hit(O, D, t_min, min(t_max, closest_t))
+        if sphere is not None and t < closest_t:
+            closest_t = t
             closest_object = sphere
             object_type = "sphere"
-            
-    for triangle in scene.Triangles:
-        t = intersect_ray_triangle(O, D, triangle)
-        if t_min <= t <= t_max and t < closest_t:
-            closest_t = t
-            closest_object = triangle
-            object_type = "triangle"
 
-    if closest_object is None:
-        return BACKGROUND_COLOR
+    t, triangle = scene.TriangleBVH.closest_hit(O, D, t_min, min(t_max, closest_t))
+    if triangle is not None and t < closest_t:
+        closest_t = t
+        closest_object = triangle
+        object_type = "triangle"
 
-    P = O + (D * closest_t)
-    V = D * (-1)
+    return closest_t, closest_object, object_type
+
+
+def surface_at(O, D, t, obj, object_type):
+    """
+    Geometry and material of the hit point: returns (P, N, base_color), with the
+    normal N facing the incoming ray and the texture already applied to base_color.
+    """
+    P = O.madd(D, t)
 
     if object_type == "sphere":
-        N = (P - closest_object.center).normalize()
-        base_color = closest_object.color
-    elif object_type == "plane":
-        N = closest_object.normal
-        base_color = closest_object.color
+        N = (P - obj.center).normalize_in_place()
     else:
-        N = closest_object.normal
-        base_color = closest_object.color
+        N = obj.normal
 
     if N.dot(D) > 0:
         N = N * -1
 
+    if obj.texture:
+        u, v = sphere_uv(P, obj) if object_type == "sphere" else (0, 0)
+        base_color = obj.texture.get_color(u, v)
+    else:
+        base_color = obj.color
+
+    return P, N, base_color
+
+
+REFLECTION_DEPTH = 3
+# Poids minimal d'un rebond dans le pixel : en dessous, il change chaque composante de
+# moins d'un demi-niveau sur 255
+REFLECTION_MIN_WEIGHT = 0.5 / 255
+# Roulette russe (optionnelle) à partir de ce nombre de rebonds
+ROULETTE_DEPTH = 2
+
+
+def roulette_sample(P):
+    """
+    Pseudo-random number in [0, 1) derived from the hit point P, so that the
+    Russian roulette gives the same image whatever the tiles or worker processes.
+    """
+    x = math.sin(P.x * 12.9898 + P.y * 78.233 + P.z * 37.719) * 43758.5453
+    return x - math.floor(x)
+
+
+def local_color(P, N, D, obj, base_color, scene):
+    """Color of the hit point P lit by the scene lights, without reflections"""
+    V = D * (-1)
+
     lighting = compute_lighting(
         P, N, V,
-        closest_object.specular,
+        obj.specular,
         scene,
-        closest_object
+        obj
     )
     lighting = max(0, min(1, lighting))
 
-    if closest_object.texture:
-        u, v = sphere_uv(P, closest_object) if object_type == "sphere" else (0, 0)
-        base_color = closest_object.texture.get_color(u, v)
-    else:
-        base_color = closest_object.color
-
-    local_color = (
+    return (
         int(base_color[0] * lighting),
         int(base_color[1] * lighting),
         int(base_color[2] * lighting),
     )
 
-    reflective = closest_object.reflective
 
-    if depth <= 0 or reflective <= 0:
-        return local_color
+def shade(P, N, D, obj, base_color, scene, depth=REFLECTION_DEPTH, min_weight=REFLECTION_MIN_WEIGHT,
+          roulette=False):
+    """
+    Color seen along D at the hit point P: lighting, then up to `depth` reflections.
+    Reflections are followed in a loop that tracks the weight of the next bounce in
+    the pixel; the chain stops once that weight is below min_weight (by default, when
+    the bounce can no longer change the 8-bit color). With roulette, bounces past
+    ROULETTE_DEPTH are followed with probability `reflective` and their difference
+    to the local color is scaled by 1 / reflective. Such a chain is blended in floats
+    and truncated once, so its expected color is the untruncated blend; without
+    roulette every bounce is truncated to integers, as in the recursive version,
+    which is a few levels darker on long mirror chains.
+    """
+    # (couleur locale, coefficient de réflexion, probabilité de survie) de chaque rebond
+    bounces = []
+    weight = 1.0
+    rouletted = False
+
+    while True:
+        color = local_color(P, N, D, obj, base_color, scene)
+        reflective = obj.reflective
+
+        if depth <= 0 or reflective <= 0 or weight * reflective < min_weight:
+            break
+        survival = 1.0
+        if roulette and len(bounces) >= ROULETTE_DEPTH and reflective < 1:
+            if roulette_sample(P) >= reflective:
+                break
+            survival = reflective
+            rouletted = True
+
+        bounces.append((color, reflective, survival))
+        weight *= reflective
+        depth -= 1
+
+        O = P.madd(N, 0.001)
+        D = reflect_ray(D, N).normalize_in_place()
+        RENDER_STATS["rays"] += 1
+        RENDER_STATS["reflection_rays"] += 1
+        t, obj, object_type = closest_intersection(O, D, 0.001, INF, scene)
+        if obj is None:
+            color = BACKGROUND_COLOR
+            break
+        P, N, base_color = surface_at(O, D, t, obj, object_type)
+
+    # Mélange du dernier rebond vers le premier, avec la même troncature qu'en récursif
+    if not rouletted:
+        for local, reflective, survival in reversed(bounces):
+            color = (
+                int(local[0] * (1 - reflective) + color[0] * reflective),
+                int(local[1] * (1 - reflective) + color[1] * reflective),
+                int(local[2] * (1 - reflective) + color[2] * reflective),
+            )
+        return color
 
-    R_dir = reflect_ray(D, N).normalize()
-    reflect_origin = P + N * 0.001
-    reflected_color = trace_ray(reflect_origin, R_dir, 0.001, INF, scene, depth - 1)
+    # Avec la roulette, tronquer à chaque rebond amplifierait l'erreur par 1 / survie :
+    # le mélange reste en flottants et n'est tronqué qu'une fois, à la fin
+    for local, reflective, survival in reversed(bounces):
+        if survival < 1:
+            color = tuple(l + (c - l) / survival for l, c in zip(local, color))
+        color = tuple(l * (1 - reflective) + c * reflective for l, c in zip(local, color))
+    # La correction 1 / survie peut sortir de 0..255
+    return tuple(int(max(0, min(255, c))) for c in color)
 
-    r = int(local_color[0] * (1 - reflective) + reflected_color[0] * reflective)
-    g = int(local_color[1] * (1 - reflective) + reflected_color[1] * reflective)
-    b = int(local_color[2] * (1 - reflective) + reflected_color[2] * reflective)
-    return (r, g, b)
+
+def trace_ray(O, D, t_min, t_max, scene, depth=REFLECTION_DEPTH, min_weight=REFLECTION_MIN_WEIGHT, roulette=False):
+    """
+    Trace a ray and return the color at the nearest intersection.
+    Supports reflections up to `depth` (see shade).
+    """
+    RENDER_STATS["rays"] += 1
+    t, obj, object_type = closest_intersection(O, D, t_min, t_max, scene)
+
+    if obj is None:
+        return BACKGROUND_COLOR
+
+    P, N, base_color = surface_at(O, D, t, obj, object_type)
+    return shade(P, N, D, obj, base_color, scene, depth, min_weight, roulette)
+
+
+class SceneParseError(ValueError):
+    """Syntax or content error in a scene file, with its line and column"""
+
+    def __init__(self, message, filename, line, column):
+        super().__init__(f"{filename}:{line}:{column}: {message}")
+        self.filename = filename
+        self.line = line
+        self.column = column
+
+
+# Lexèmes d'une ligne : commentaire, accolade, affectation "clé = valeur", nom de bloc ou erreur
+_TOKEN_RE = re.compile(r"""
+    \s*
+    (?:
+        (?P<comment>\#.*)
+      | (?P<brace>[{}])
+      | (?P<key>[A-Za-z_]\w*)[ \t]*=[ \t]*(?P<value>\([^()\n]*\)|"[^"\n]*"|[^\s\#{}()"=]+)
+      | (?P<name>[A-Za-z_]\w*)(?!\w|[ \t]*=)
+      | (?P<bad>\S[^\s=]*[ \t]*=?)
+    )""", re.VERBOSE)
+
+
+def _split_tuple(value):
+    parts = value[1:-1].split(",")
+    if value[:1] != "(" or value[-1:] != ")" or len(parts) != 3:
+        raise ValueError(f"expected a tuple (x, y, z), got {value!r}")
+    return parts
+
+
+def _parse_vector(value):
+    x, y, z = _split_tuple(value)
+    return Vector(float(x), float(y), float(z))
+
+
+def _parse_color(value):
+    r, g, b = _split_tuple(value)
+    return (int(float(r)), int(float(g)), int(float(b)))
+
+
+def _parse_word(value):
+    if not value.isidentifier():
+        raise ValueError(f"expected a name, got {value!r}")
+    return value
+
+
+def _parse_string(value):
+    if not (value.startswith('"') and value.endswith('"')) or value.count('"') != 2:
+        raise ValueError(f'expected a quoted string, got {value!r}')
+    return value[1:-1]
+
+
+_TEXTURES = {
+    "checker": lambda: CheckerTexture((255, 255, 255), (0, 0, 0), scale=10),
+}
+
+
+def _parse_texture(value):
+    name = _parse_word(value)
+    if name not in _TEXTURES:
+        raise ValueError(f"unknown texture {name!r}")
+    return _TEXTURES[name]()
+
+
+# Champs autorisés dans chaque bloc, avec leur conversion
+SCENE_BLOCKS = {
+    "sphere": {
+        "center": _parse_vector,
+        "radius": float,
+        "color": _parse_color,
+        "specular": float,
+        "reflective": float,
+        "texture": _parse_texture,
+    },
+    "triangle": {
+        "v0": _parse_vector,
+        "v1": _parse_vector,
+        "v2": _parse_vector,
+        "color": _parse_color,
+        "specular": float,
+        "reflective": float,
+    },
+    "mesh": {
+        "file": _parse_string,
+        "color": _parse_color,
+        "specular": float,
+        "reflective": float,
+        "position": _parse_vector,
+        "scale": float,
+    },
+    "light": {
+        "type": _parse_word,
+        "intensity": float,
+        "position": _parse_vector,
+        "direction": _parse_vector,
+    },
+}
+
+_REQUIRED_FIELDS = {
+    "sphere": frozenset(("center", "radius", "color")),
+    "triangle": frozenset(("v0", "v1", "v2", "color")),
+    "mesh": frozenset(("file", "color")),
+    "light": frozenset(("type", "intensity")),
+}
+
+LIGHT_TYPES = ("ambient", "point", "directional")
+
+
+def _build_block(kind, fields, base_dir=""):
+    """
+    Create the scene object of a parsed block; raises ValueError if it is incomplete.
+    Mesh files are looked up relative to base_dir.
+    """
+    if not fields.keys() >= _REQUIRED_FIELDS[kind]:
+        missing = sorted(_REQUIRED_FIELDS[kind] - fields.keys())
+        raise ValueError(f"{kind} block without {', '.join(missing)}")
+
+    if kind == "sphere":
+        return Sphere(
+            fields['center'],
+            fields['radius'],
+            fields['color'],
+            fields.get('specular', 100),
+            fields.get('reflective', 0.0),
+            fields.get('texture', None)
+        )
+    if kind == "triangle":
+        return Triangle(
+            fields["v0"],
+            fields["v1"],
+            fields["v2"],
+            fields["color"],
+            fields.get("specular", 100),
+            fields.get("reflective", 0.0),
+            None
+        )
+    if kind == "mesh":
+        source = os.path.join(base_dir, fields["file"])
+        vertices, faces = load_obj(source)
+        scale = fields.get("scale", 1.0)
+        offset = fields.get("position", Vector(0, 0, 0))
+        if scale != 1.0 or offset.x or offset.y or offset.z:
+            for i in range(0, len(vertices), 3):
+                vertices[i] = vertices[i] * scale + offset.x
+                vertices[i + 1] = vertices[i + 1] * scale + offset.y
+                vertices[i + 2] = vertices[i + 2] * scale + offset.z
+        return Mesh(
+            vertices,
+            faces,
+            fields["color"],
+            fields.get("specular", 100),
+            fields.get("reflective", 0.0),
+            source=source
+        )
+
+    if fields['type'] not in LIGHT_TYPES:
+        raise ValueError(f"unknown light type {fields['type']!r}")
+    if fields['type'] == "point" and 'position' not in fields:
+        raise ValueError("point light without position")
+    if fields['type'] == "directional" and 'direction' not in fields:
+        raise ValueError("directional light without direction")
+    return Light(
+        fields['type'],
+        fields['intensity'],
+        fields.get('position'),
+        fields.get('direction')
+    )
+
+
+def _line_tokens(line):
+    """
+    Tokens (kind, text, column, value, value_column) of one line, kind being
+    "name", "brace" or "field". Raises ValueError(message, column) on junk.
+    """
+    # Lignes usuelles "nom {" et "}" découpées sans expression régulière
+    text = line.strip()
+    if text == "}":
+        return (("brace", "}", line.index("}") + 1, None, 0),)
+    if text.endswith("{") and text[:-1].rstrip().isidentifier():
+        name = text[:-1].rstrip()
+        return (("name", name, line.index(name) + 1, None, 0),
+                ("brace", "{", line.rindex("{") + 1, None, 0))
+
+    tokens = []
+    for m in _TOKEN_RE.finditer(line):
+        token = m.lastgroup
+        if token == "value":
+            tokens.append(("field", m.group("key"), m.start("key") + 1, m.group("value"), m.start("value") + 1))
+        elif token == "bad":
+            bad = m.group("bad")
+            if bad.endswith("="):
+                message = f"missing or malformed value for {bad.rstrip(' =')!r}"
+            else:
+                message = f"unexpected {bad.strip()!r}"
+            raise ValueError(message, m.start("bad") + 1)
+        elif token != "comment":
+            tokens.append((token, m.group(token), m.start(token) + 1, None, 0))
+    return tokens
+
+
+# Lexèmes d'une ligne "}" seule, fermant le bloc en cours
+_CLOSE_TOKENS = (("brace", "}", 0, None, 0),)
+
+
+def parse_scene_file(input_file):
+    """
+    Parse a scene file (sphere, triangle, mesh and light blocks, # comments) in a single
+    streaming pass over its lines. Returns (spheres, triangles, lights), the faces of
+    meshes being included in triangles.
+    Raises SceneParseError with the line and column of the first error.
+    """
+    objects = {"sphere": [], "triangle": [], "light": []}
+    base_dir = os.path.dirname(input_file)
+    kind = None         # bloc en cours, ou nom lu en attente de "{"
+    fields = None       # champs du bloc en cours, None hors d'un bloc
+    schema = None
+    block_line = block_column = 0
+
+    with open(input_file, 'r') as f:
+        for lineno, line in enumerate(f, 1):
+            # Chemins rapides sans expression régulière : "clé = valeur" et "}" dans un
+            # bloc, "nom {" hors d'un bloc. Toute valeur refusée par la conversion repasse
+            # par le découpage complet, qui localise l'erreur.
+            if fields is not None:
+                key, equal, value = line.partition("=")
+                if equal:
+                    key = key.strip()
+                    convert = schema.get(key)
+                    if convert is not None and key not in fields:
+                        try:
+                            fields[key] = convert(value.partition("#")[0].strip())
+                            continue
+                        except ValueError:
+                            pass
+                    tokens = None
+                else:
+                    tokens = _CLOSE_TOKENS if line.strip() == "}" else None
+            else:
+                if kind is None:
+                    text = line.strip()
+                    if text.endswith("{"):
+                        name = text[:-1].rstrip()
+                        if name in SCENE_BLOCKS:
+                            kind, schema, fields = name, SCENE_BLOCKS[name], {}
+                            block_line, block_column = lineno, line.index(name) + 1
+                            continue
+                tokens = None
+
+            if tokens is None:
+                try:
+                    tokens = _line_tokens(line)
+                except ValueError as e:
+                    message, column = e.args
+                    raise SceneParseError(message, input_file, lineno, column) from None
+
+            for token, text, column, value, value_column in tokens:
+                if token == "field":
+                    if fields is None:
+                        raise SceneParseError(f"field {text!r} outside of a block", input_file, lineno, column)
+                    if text not in schema:
+                        raise SceneParseError(f"unknown field {text!r} in {kind} block", input_file, lineno, column)
+                    if text in fields:
+                        raise SceneParseError(f"duplicate field {text!r} in {kind} block", input_file, lineno, column)
+                    try:
+                        fields[text] = schema[text](value)
+                    except ValueError as e:
+                        raise SceneParseError(f"invalid {text}: {e}", input_file, lineno, value_column) from None
+
+                elif token == "name":
+                    if fields is not None:
+                        raise SceneParseError(f"unexpected {text!r} in {kind} block", input_file, lineno, column)
+                    if kind is not None:
+                        raise SceneParseError(f"expected '{{' after {kind!r}", input_file, lineno, column)
+                    if text not in SCENE_BLOCKS:
+                        raise SceneParseError(f"unknown block {text!r}", input_file, lineno, column)
+                    kind = text
+                    block_line, block_column = lineno, column
+
+                elif text == "{":
+                    if kind is None or fields is not None:
+                        raise SceneParseError("unexpected '{'", input_file, lineno, column)
+                    schema = SCENE_BLOCKS[kind]
+                    fields = {}
+
+                else:
+                    if fields is None:
+                        raise SceneParseError("unexpected '}'", input_file, lineno, column)
+                    try:
+                        block = _build_block(kind, fields, base_dir)
+                    except SceneParseError:
+                        raise   # erreur déjà localisée dans le fichier OBJ
+                    except ValueError as e:
+                        raise SceneParseError(str(e), input_file, block_line, block_column) from None
+                    if kind == "mesh":
+                        # Les faces du maillage rejoignent les triangles de la scène
+                        objects["triangle"].extend(block.triangles())
+                    else:
+                        objects[kind].append(block)
+                    kind = fields = None
+
+    if kind is not None:
+        raise SceneParseError(f"unterminated {kind} block", input_file, block_line, block_column)
+
+    return objects["sphere"], objects["triangle"], objects["light"]
+
+
+def load_obj(filename):
+    """
+    Stream a Wavefront OBJ file into a flat vertex buffer array('d') and a flat
+    face index buffer array('i'). Only "v" and "f" records are read: polygons are
+    split into triangle fans, normals, texture coordinates, groups and materials
+    are ignored. Raises SceneParseError on malformed records.
+    """
+    vertices = array('d')
+    faces = array('i')
+    count = 0   # sommets lus jusqu'ici, pour les indices relatifs (négatifs)
+
+    with open(filename, 'r') as f:
+        for lineno, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+
+            if parts[0] == "v":
+                try:
+                    vertices.extend((float(parts[1]), float(parts[2]), float(parts[3])))
+                except (IndexError, ValueError):
+                    raise SceneParseError("expected a vertex 'v x y z'", filename, lineno, line.index("v") + 1) from None
+                count += 1
+
+            elif parts[0] == "f":
+                if len(parts) < 4:
+                    raise SceneParseError("face with fewer than 3 vertices", filename, lineno, line.index("f") + 1)
+                indices = []
+                for token in parts[1:]:
+                    try:
+                        # "i", "i/t", "i//n" ou "i/t/n" : seul l'indice du sommet compte
+                        index = int(token.split("/", 1)[0])
+                    except ValueError:
+                        index = 0
+                    index = index + count if index < 0 else index - 1
+                    if not 0 <= index < count:
+                        raise SceneParseError(f"invalid vertex index {token!r}", filename, lineno, line.index(token) + 1)
+                    indices.append(index)
+                first = indices[0]
+                for k in range(1, len(indices) - 1):
+                    faces.extend((first, indices[k], indices[k + 1]))
+
+    return vertices, faces
 
 
-# Partiellement généré par ChatGPT
 def parse_input_file(input_file):
     """Parse book_shapes.txt format"""
-    spheres = []
-    lights = []
-    
-    with open(input_file, 'r') as f:
-        content = f.read()
-    
-    sphere_blocks = re.findall(r'sphere\s*\{([^}]+)\}', content, re.DOTALL)
-    
-    for block in sphere_blocks:
-        sphere_data = {}
-        
-        center_match = re.search(r'center\s*=\s*\(([^)]+)\)', block)
-        if center_match:
-            values = [float(x.strip()) for x in center_match.group(1).split(',')]
-            sphere_data['center'] = Vector(values[0], values[1], values[2])
-        
-        radius_match = re.search(r'radius\s*=\s*([\d.]+)', block)
-        if radius_match:
-            sphere_data['radius'] = float(radius_match.group(1))
-        
-        color_match = re.search(r'color\s*=\s*\(([^)]+)\)', block)
-        if color_match:
-            values = [int(float(x.strip())) for x in color_match.group(1).split(',')]
-            sphere_data['color'] = tuple(values)
-        
-        specular_match = re.search(r'specular\s*=\s*([\d.]+)', block)
-        if specular_match:
-            sphere_data['specular'] = float(specular_match.group(1))
-
-        reflective_match = re.search(r'reflective\s*=\s*([\d.]+)', block)
-        if reflective_match:
-            sphere_data['reflective'] = float(reflective_match.group(1))
-
-        texture_match = re.search(r'texture\s*=\s*(\w+)', block)
-        if texture_match:
-            if texture_match.group(1) == "checker":
-                sphere_data['texture'] = CheckerTexture(
-                    (255,255,255), 
-                    (0,0,0), 
-                    scale=10
-                )
-        
-        if all(k in sphere_data for k in ['center', 'radius', 'color']):
-            sphere = Sphere(
-                sphere_data['center'],
-                sphere_data['radius'],
-                sphere_data['color'],
-                sphere_data.get('specular', 100),
-                sphere_data.get('reflective', 0.0),
-                sphere_data.get('texture', None)
-            )
-            spheres.append(sphere)
-    
-    light_blocks = re.findall(r'light\s*\{([^}]+)\}', content, re.DOTALL)
-    
-    for block in light_blocks:
-        light_data = {}
-        
-        type_match = re.search(r'type\s*=\s*(\w+)', block)
-        if type_match:
-            light_data['type'] = type_match.group(1)
-        
-        intensity_match = re.search(r'intensity\s*=\s*([\d.]+)', block)
-        if intensity_match:
-            light_data['intensity'] = float(intensity_match.group(1))
-        
-        position_match = re.search(r'position\s*=\s*\(([^)]+)\)', block)
-        if position_match:
-            values = [float(x.strip()) for x in position_match.group(1).split(',')]
-            light_data['position'] = Vector(values[0], values[1], values[2])
-        
-        direction_match = re.search(r'direction\s*=\s*\(([^)]+)\)', block)
-        if direction_match:
-            values = [float(x.strip()) for x in direction_match.group(1).split(',')]
-            light_data['direction'] = Vector(values[0], values[1], values[2])
-
-        if 'type' in light_data and 'intensity' in light_data:
-            light = Light(
-                light_data['type'],
-                light_data['intensity'],
-                light_data.get('position'),
-                light_data.get('direction')
-            )
-            lights.append(light)
-    
+    spheres, _, lights = parse_scene_file(input_file)
     return spheres, lights
 
-# Partiellement généré par ChatGPT
+
 def parse_triangle_file(input_file):
-    triangles = []
-    lights = []
+    """Parse triangle_scene.txt format"""
+    _, triangles, lights = parse_scene_file(input_file)
+    return triangles, lights
 
-    with open(input_file, 'r') as f:
-        content = f.read()
-
-    tri_blocks = re.findall(r'triangle\s*\{([^}]+)\}', content, re.DOTALL)
-    for block in tri_blocks:
-        data = {}
-        def vec(name):
-            m = re.search(rf'{name}\s*=\s*\(([^)]+)\)', block)
-            if not m:
+
+SCENE_CACHE_MAGIC = b"RTSCENE\0"
+SCENE_CACHE_VERSION = 3
+# magic, version, sha256 du fichier source, taille du JSON, CRC-32 de tout ce qui suit l'en-tête
+_CACHE_HEADER = struct.Struct("<8sI32sQI")
+
+
+def scene_cache_path(input_file):
+    return input_file + ".cache"
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def _texture_record(texture):
+    if texture is None:
+        return None
+    if isinstance(texture, CheckerTexture):
+        return {"type": "checker", "color1": list(texture.color1), "color2": list(texture.color2),
+                "scale": texture.scale}
+    raise ValueError(f"texture {type(texture).__name__} cannot be cached")
+
+
+def _texture_from_record(record):
+    if record is None:
+        return None
+    return CheckerTexture(tuple(record["color1"]), tuple(record["color2"]), record["scale"])
+
+
+def _vector_record(v):
+    return None if v is None else [v.x, v.y, v.z]
+
+
+def save_scene_cache(path, source_hash, spheres, triangles, lights, bvh):
+    """
+    Write parsed scene content and the BVH of its triangles to a binary cache: a fixed
+    header, a JSON table of contents (lights, materials, sections), then 8-byte aligned
+    float64/int32 sections that load_scene_cache maps back without copying.
+    """
+    sections = []   # (name, typecode, array)
+
+    sphere_data = array('d')
+    sphere_colors = array('i')
+    textures = []
+    for s in spheres:
+        sphere_data.extend((s.center.x, s.center.y, s.center.z, s.radius, s.specular, s.reflective))
+        sphere_colors.extend(s.color)
+        textures.append(_texture_record(s.texture))
+    sections += [("spheres", 'd', sphere_data), ("sphere_colors", 'i', sphere_colors)]
+
+    # Les triangles isolés et les faces des maillages sont rangés par plages, dans l'ordre de la scène
+    runs = []
+    meshes = []
+    mesh_index = {}
+    triangle_data = array('d')
+    triangle_colors = array('i')
+    for t in triangles:
+        if isinstance(t, MeshTriangle):
+            if t.mesh not in mesh_index:
+                mesh_index[t.mesh] = len(meshes)
+                meshes.append(t.mesh)
+            k = mesh_index[t.mesh]
+            if runs and runs[-1][0] == "mesh" and runs[-1][1] == k and runs[-1][3] == t.face:
+                runs[-1][3] += 1
+            else:
+                runs.append(["mesh", k, t.face, t.face + 1])
+            continue
+        triangle_data.extend((t.v0.x, t.v0.y, t.v0.z, t.v1.x, t.v1.y, t.v1.z,
+                              t.v2.x, t.v2.y, t.v2.z, t.specular, t.reflective))
+        triangle_colors.extend(t.color)
+        if runs and runs[-1][0] == "triangle":
+            runs[-1][1] += 1
+        else:
+            runs.append(["triangle", 1])
+    sections += [("triangles", 'd', triangle_data), ("triangle_colors", 'i', triangle_colors)]
+
+    mesh_records = []
+    for k, mesh in enumerate(meshes):
+        sections.append((f"mesh{k}_vertices", 'd', mesh.vertices))
+        sections.append((f"mesh{k}_faces", 'i', mesh.faces))
+        mesh_records.append({"color": list(mesh.color), "specular": mesh.specular,
+                             "reflective": mesh.reflective, "texture": _texture_record(mesh.texture)})
+
+    # Nœuds du BVH (boîtes, puis gauche, droite, début, nombre, axe) et rang dans la scène des triangles des feuilles
+    rank = {id(t): k for k, t in enumerate(triangles)}
+    bvh_bounds = array('d')
+    bvh_links = array('i')
+    for b, left, right, start, count, axis in bvh.nodes:
+        bvh_bounds.extend(b)
+        bvh_links.extend((left, right, start, count, axis))
+    sections += [("bvh_bounds", 'd', bvh_bounds), ("bvh_links", 'i', bvh_links),
+                 ("bvh_order", 'i', array('i', [rank[id(t)] for t in bvh.triangles]))]
+
+    offset = 0
+    table = {}
+    for name, typecode, data in sections:
+        nbytes = len(data) * array(typecode).itemsize
+        table[name] = [offset, nbytes, typecode]
+        offset += (nbytes + 7) & ~7
+
+    contents = json.dumps({
+        "byteorder": sys.byteorder,
+        "dependencies": [_file_signature(m.source) for m in meshes if m.source],
+        "sphere_textures": textures,
+        "runs": runs,
+        "meshes": mesh_records,
+        "lights": [[l.type, l.intensity, _vector_record(l.position), _vector_record(l.direction)]
+                   for l in lights],
+        "sections": table,
+    }).encode()
+    # Le JSON est complété pour que les sections commencent sur 8 octets
+    contents += b" " * (-(_CACHE_HEADER.size + len(contents)) % 8)
+
+    payload = [contents]
+    for name, typecode, data in sections:
+        raw = memoryview(data).cast('B')
+        payload.append(raw)
+        payload.append(b"\0" * (-len(raw) % 8))
+    crc = 0
+    for chunk in payload:
+        crc = zlib.crc32(chunk, crc)
+
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_CACHE_HEADER.pack(SCENE_CACHE_MAGIC, SCENE_CACHE_VERSION, source_hash, len(contents), crc))
+        for chunk in payload:
+            f.write(chunk)
+    os.replace(tmp, path)
+
+
+def load_scene_cache(path, source_hash):
+    """
+    Load a cache written by save_scene_cache as (spheres, triangles, lights, bvh), or
+    return None if it is missing, from another version, stale or damaged. Mesh buffers
+    are memoryviews over the mapped file.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mm) < _CACHE_HEADER.size:
+        return None
+    magic, version, digest, size, crc = _CACHE_HEADER.unpack_from(mm)
+    if magic != SCENE_CACHE_MAGIC or version != SCENE_CACHE_VERSION or digest != source_hash:
+        return None
+    if zlib.crc32(memoryview(mm)[_CACHE_HEADER.size:]) != crc:
+        return None
+    # Un cache tronqué ou abîmé ne doit jamais faire échouer le rendu : on relit la scène
+    try:
+        contents = json.loads(bytes(mm[_CACHE_HEADER.size:_CACHE_HEADER.size + size]))
+        if contents["byteorder"] != sys.byteorder:
+            return None
+        for dependency in contents["dependencies"]:
+            try:
+                if _file_signature(dependency[0]) != dependency:
+                    return None
+            except OSError:
                 return None
-            vals = [float(x.strip()) for x in m.group(1).split(',')]
-            return Vector(vals[0], vals[1], vals[2])
-
-        data["v0"] = vec("v0")
-        data["v1"] = vec("v1")
-        data["v2"] = vec("v2")
-
-        color_match = re.search(r'color\s*=\s*\(([^)]+)\)', block)
-        spec_match = re.search(r'specular\s*=\s*([\d.]+)', block)
-        refl_match = re.search(r'reflective\s*=\s*([\d.]+)', block)
-
-        if color_match:
-            data["color"] = tuple(int(float(x.strip())) for x in color_match.group(1).split(','))
-
-        if all(k in data for k in ["v0", "v1", "v2", "color"]):
-            triangles.append(Triangle(
-                data["v0"],
-                data["v1"],
-                data["v2"],
-                data["color"],
-                float(spec_match.group(1)) if spec_match else 100,
-                float(refl_match.group(1)) if refl_match else 0.0,
-                None
-            ))
-
-    light_blocks = re.findall(r'light\s*\{([^}]+)\}', content, re.DOTALL)
-    for block in light_blocks:
-        light_data = {}
-        type_match = re.search(r'type\s*=\s*(\w+)', block)
-        intensity_match = re.search(r'intensity\s*=\s*([\d.]+)', block)
-        position_match = re.search(r'position\s*=\s*\(([^)]+)\)', block)
-        direction_match = re.search(r'direction\s*=\s*\(([^)]+)\)', block)
-
-        if type_match:
-            light_data['type'] = type_match.group(1)
-        if intensity_match:
-            light_data['intensity'] = float(intensity_match.group(1))
-        if position_match:
-            vals = [float(x.strip()) for x in position_match.group(1).split(',')]
-            light_data['position'] = Vector(*vals)
-        if direction_match:
-            vals = [float(x.strip()) for x in direction_match.group(1).split(',')]
-            light_data['direction'] = Vector(*vals)
-
-        if 'type' in light_data and 'intensity' in light_data:
-            lights.append(Light(
-                light_data['type'],
-                light_data['intensity'],
-                light_data.get('position'),
-                light_data.get('direction')
-            ))
 
-    return triangles, lights
+        base = _CACHE_HEADER.size + size
+        view = memoryview(mm)
+
+        def section(name):
+            offset, nbytes, typecode = contents["sections"][name]
+            if offset < 0 or base + offset + nbytes > len(mm):
+                raise ValueError(f"section {name} is outside the cache file")
+            return view[base + offset:base + offset + nbytes].cast(typecode)
+
+        data, colors = section("spheres"), section("sphere_colors")
+        spheres = []
+        for k, texture in enumerate(contents["sphere_textures"]):
+            cx, cy, cz, radius, specular, reflective = data[6 * k:6 * k + 6]
+            spheres.append(Sphere(Vector(cx, cy, cz), radius, tuple(colors[3 * k:3 * k + 3]),
+                                  specular, reflective, _texture_from_record(texture)))
+
+        meshes = []
+        for k, record in enumerate(contents["meshes"]):
+            vertices, faces = section(f"mesh{k}_vertices"), section(f"mesh{k}_faces")
+            if len(vertices) % 3 or len(faces) % 3:
+                raise ValueError(f"mesh {k} has incomplete vertices or faces")
+            meshes.append(Mesh(vertices, faces,
+                               tuple(record["color"]), record["specular"], record["reflective"],
+                               _texture_from_record(record["texture"])))
+
+        data, colors = section("triangles"), section("triangle_colors")
+        triangles = []
+        k = 0
+        for run in contents["runs"]:
+            if run[0] == "mesh":
+                mesh = meshes[run[1]]
+                if not 0 <= run[2] <= run[3] <= len(mesh.faces) // 3:
+                    raise ValueError(f"mesh run {run} is outside the mesh faces")
+                triangles.extend(MeshTriangle(mesh, f) for f in range(run[2], run[3]))
+                continue
+            for _ in range(run[1]):
+                c = data[11 * k:11 * k + 11]
+                triangles.append(Triangle(Vector(c[0], c[1], c[2]), Vector(c[3], c[4], c[5]),
+                                          Vector(c[6], c[7], c[8]), tuple(colors[3 * k:3 * k + 3]),
+                                          c[9], c[10]))
+                k += 1
+
+        lights = [Light(kind, intensity,
+                        Vector(*position) if position else None,
+                        Vector(*direction) if direction else None)
+                  for kind, intensity, position, direction in contents["lights"]]
+        for light in lights:
+            if light.type not in LIGHT_TYPES or (light.type == "point" and light.position is None) \
+                    or (light.type == "directional" and light.direction is None):
+                raise ValueError(f"invalid light {light.type!r}")
+
+        bounds, links, order = section("bvh_bounds"), section("bvh_links").tolist(), section("bvh_order")
+        node_count = len(links) // 5
+        if len(links) % 5 or len(bounds) != 6 * node_count or len(order) != len(triangles) \
+                or max(links[0::5] + links[1::5], default=-1) >= node_count:
+            raise ValueError("the BVH does not match the triangles")
+        bvh = BVH.from_arrays([triangles[k] for k in order], bounds.tolist(), links)
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+    return spheres, triangles, lights, bvh
+
+
+def load_scene_file(input_file, cache=False):
+    """
+    parse_scene_file, optionally through a binary cache stored next to the scene file.
+    The cache is keyed by the SHA-256 of the scene file (and the size and mtime of the
+    OBJ files it loads), and rebuilt whenever one of them changes.
+    Returns (spheres, triangles, lights, bvh), bvh being the BVH of the triangles read
+    from or written to the cache (None without cache), to be passed on to Scene().
+    """
+    if not cache:
+        return parse_scene_file(input_file) + (None,)
+
+    with open(input_file, 'rb') as f:
+        source_hash = hashlib.sha256(f.read()).digest()
+    path = scene_cache_path(input_file)
+
+    parsed = load_scene_cache(path, source_hash)
+    if parsed is None:
+        spheres, triangles, lights = parse_scene_file(input_file)
+        parsed = spheres, triangles, lights, BVH(triangles)
+        try:
+            save_scene_cache(path, source_hash, *parsed)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: could not write scene cache {path}: {e}")
+    return parsed
 
 
 def sphere_uv(P, sphere):
-    p = (P - sphere.center).normalize()
+    p = (P - sphere.center).normalize_in_place()
 
     u = 0.5 + math.atan2(p.z, p.x) / (2 * math.pi)
     v = 0.5 - math.asin(p.y) / math.pi
@@ -515,9 +2192,9 @@ def sphere_uv(P, sphere):
     return u, v
 
 
-def create_scene():
+def create_scene(cache=False):
     """Create scene with spheres and lights from book_shapes.txt"""
-    spheres, lights = parse_input_file('book_shapes.txt')
+    spheres, triangles, lights, bvh = load_scene_file('book_shapes.txt', cache)
     planes = [
         Plane(Vector(0, -2, 0), Vector(0, 1, 0), (200, 200, 200)),      # sol
         Plane(Vector(0, 0, 10), Vector(0, 0, -1), (180, 190, 200)),     # mur fond
@@ -526,12 +2203,11 @@ def create_scene():
         Plane(Vector(0, 5, 0), Vector(0, -1, 0), (200, 200, 200))       # plafond
     ]
     
-    return Scene(spheres, planes, lights)
+    return Scene(spheres, planes, lights, triangles=triangles, bvh=bvh)
 
 
-def create_triangle_scene():
-    triangles, lights = parse_triangle_file("triangle_scene.txt")
-    spheres = []
+def create_triangle_scene(cache=False):
+    spheres, triangles, lights, bvh = load_scene_file("triangle_scene.txt", cache)
     planes = [
         Plane(Vector(0, -2, 0), Vector(0, 1, 0), (200, 200, 200)),      # sol
         Plane(Vector(0, 0, 10), Vector(0, 0, -1), (180, 190, 200)),     # mur fond
@@ -540,12 +2216,12 @@ def create_triangle_scene():
         Plane(Vector(0, 5, 0), Vector(0, -1, 0), (200, 200, 200))       # plafond
     ]
 
-    return Scene(spheres, planes, lights, triangles=triangles)
+    return Scene(spheres, planes, lights, triangles=triangles, bvh=bvh)
 
 
-def create_scene_moove():
+def create_scene_moove(cache=False):
     """Create scene with spheres and lights from book_shapes.txt"""
-    spheres, lights = parse_input_file('shapes_move.txt')
+    spheres, triangles, lights, bvh = load_scene_file('shapes_move.txt', cache)
     planes = [
         Plane(Vector(0, -2, 0), Vector(0, 1, 0), (200, 200, 200)),      # sol
         Plane(Vector(0, 0, 10), Vector(0, 0, -1), (180, 190, 200)),     # mur fond
@@ -554,7 +2230,7 @@ def create_scene_moove():
         Plane(Vector(0, 5, 0), Vector(0, -1, 0), (200, 200, 200))       # plafond
     ]
     
-    return Scene(spheres, planes, lights)
+    return Scene(spheres, planes, lights, triangles=triangles, bvh=bvh)
 
 
 def orbit_light(center, radius, angle_deg, height=2):
@@ -582,56 +2258,1209 @@ def animate_spheres(scene, initial_centers, frame, total_frames):
         )
 
 
-def render_image(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
-    """Render scene to PPM image"""
-    image = []
-    
-    for y in range(height // 2, -height // 2, -1):
-        row = []
-        for x in range(-width // 2, width // 2):
-            D = canvas_to_viewport(x, y).normalize()
-            O = Vector(0, 0, 0)
-            color = trace_ray(O, D, 1.0, INF, scene, depth=3)
-            row.append(color)
-        image.append(row)
-    
+def setup_animation_frame(scene, scene_name, initial_centers, frame, total_frames, radius=5, height=3):
+    """
+    Put the scene in the state of the given frame of the animation.
+    The state only depends on the frame index, so frames can be rendered in any order.
+    Returns the light angle in degrees.
+    """
+    angle = (360 / total_frames) * frame
+
+    if len(scene.Lights) > 1:
+        if scene_name == "move" and len(scene.Spheres) > 0:
+            animate_spheres(scene, initial_centers, frame, total_frames)
+            compile_scene(scene)
+        if len(scene.Spheres) > 0:
+            center = scene.Spheres[0].center
+        elif len(scene.Triangles) > 0:
+            cx = sum(t.v0.x + t.v1.x + t.v2.x for t in scene.Triangles) / (3 * len(scene.Triangles))
+            cy = sum(t.v0.y + t.v1.y + t.v2.y for t in scene.Triangles) / (3 * len(scene.Triangles))
+            cz = sum(t.v0.z + t.v1.z + t.v2.z for t in scene.Triangles) / (3 * len(scene.Triangles))
+            center = Vector(cx, cy, cz)
+        else:
+            center = Vector(0, 0, 5)
+
+        if scene_name != "move":
+            scene.Lights[1].position = orbit_light(
+                center,
+                radius=radius,
+                angle_deg=angle,
+                height=height
+            )
+
+    return angle
+
+
+def render_tile(scene, x0, x1, y0, y1, camera=None, depth=REFLECTION_DEPTH, roulette=False):
+    """
+    Render the columns x0..x1 and rows y0..y1 of the image seen by camera (0 = top-left
+    pixel, default: Camera()). Returns the tile as a Framebuffer of size (x1 - x0) x (y1 - y0).
+    roulette: Russian roulette on deep reflections (see shade).
+    """
+    if camera is None:
+        camera = Camera()
+    columns, distance = camera.columns, camera.distance
+    tile = Framebuffer(x1 - x0, y1 - y0)
+    O = Vector(0, 0, 0)
+
+    # Rayons primaires par paquets de PACKET_SIZE x PACKET_SIZE pixels : les objets hors du
+    # frustum du paquet sont écartés une fois pour tout le paquet
+    for py in range(y0, y1, PACKET_SIZE):
+        py1 = min(py + PACKET_SIZE, y1)
+        for px in range(x0, x1, PACKET_SIZE):
+            px1 = min(px + PACKET_SIZE, x1)
+            packet = PacketScene(scene, camera.frustum(px, px1, py, py1))
+            for j in range(py, py1):
+                vy = camera.rows[j]
+                k = 3 * ((j - y0) * (x1 - x0) + (px - x0))
+                for i in range(px, px1):
+                    D = Vector(columns[i], vy, distance).normalize_in_place()
+                    RENDER_STATS["rays"] += 1
+                    t, obj, object_type = closest_intersection(O, D, 1.0, INF, packet)
+                    if obj is None:
+                        color = BACKGROUND_COLOR
+                    else:
+                        P, N, base_color = surface_at(O, D, t, obj, object_type)
+                        color = shade(P, N, D, obj, base_color, scene, depth, roulette=roulette)
+                    tile[k:k + 3] = color
+                    k += 3
+
+    return tile
+
+
+def render_image(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, depth=REFLECTION_DEPTH, fov=None, roulette=False):
+    """Render scene to a Framebuffer"""
+    return render_tile(scene, 0, width, 0, height, Camera(width, height, fov), depth, roulette)
+
+
+AA_THRESHOLD = 16
+AA_BAND_HEIGHT = 16
+
+
+def _primary_sample(scene, camera, O, x, y, depth, roulette):
+    """trace_ray through the canvas point (x, y), also returning the object seen (None for the background)"""
+    D = camera.viewport(x, y).normalize_in_place()
+    RENDER_STATS["rays"] += 1
+    t, obj, object_type = closest_intersection(O, D, 1.0, INF, scene)
+    if obj is None:
+        return BACKGROUND_COLOR, None
+    P, N, base_color = surface_at(O, D, t, obj, object_type)
+    return shade(P, N, D, obj, base_color, scene, depth, roulette=roulette), obj
+
+
+def _differs(colors, ids, p, q, threshold):
+    if ids[p] is not ids[q]:
+        return True
+    a, b = colors[p], colors[q]
+    return abs(a[0] - b[0]) > threshold or abs(a[1] - b[1]) > threshold or abs(a[2] - b[2]) > threshold
+
+
+def render_tile_adaptive(scene, x0, x1, y0, y1, camera=None, max_samples=16, threshold=AA_THRESHOLD,
+                         depth=REFLECTION_DEPTH, roulette=False):
+    """
+    render_tile with adaptive supersampling. One ray per pixel is traced first; pixels
+    whose color differs from a neighbour's by more than threshold (on a channel), or
+    that see another object (all the faces of a mesh being one object), are then resampled on an n x n sub-pixel grid,
+    n = isqrt(max_samples). With max_samples < 4 the output is that of render_tile.
+    """
+    if camera is None:
+        camera = Camera()
+    width, height = camera.width, camera.height
+    O = Vector(0, 0, 0)
+
+    # Premier passage sur la tuile élargie d'un pixel : les pixels du bord ont aussi leurs voisins
+    ex0, ex1 = max(x0 - 1, 0), min(x1 + 1, width)
+    ey0, ey1 = max(y0 - 1, 0), min(y1 + 1, height)
+    w = ex1 - ex0
+    colors, ids = [], []
+    for j in range(ey0, ey1):
+        y = height // 2 - j
+        for i in range(ex0, ex1):
+            color, obj = _primary_sample(scene, camera, O, -width // 2 + i, y, depth, roulette)
+            colors.append(color)
+            # Les faces d'un même maillage comptent comme un seul objet : seul leur contour est suréchantillonné
+            ids.append(getattr(obj, "mesh", obj))
+
+    n = math.isqrt(max_samples)
+    offsets = [((a + 0.5) / n - 0.5, (b + 0.5) / n - 0.5) for b in range(n) for a in range(n)]
+
+    tile = Framebuffer(x1 - x0, y1 - y0)
+    k = 0
+    for j in range(y0, y1):
+        y = height // 2 - j
+        for i in range(x0, x1):
+            p = (j - ey0) * w + (i - ex0)
+            color = colors[p]
+            if n > 1 and (
+                (i > ex0 and _differs(colors, ids, p, p - 1, threshold))
+                or (i < ex1 - 1 and _differs(colors, ids, p, p + 1, threshold))
+                or (j > ey0 and _differs(colors, ids, p, p - w, threshold))
+                or (j < ey1 - 1 and _differs(colors, ids, p, p + w, threshold))
+            ):
+                RENDER_STATS["aa_pixels"] += 1
+                x = -width // 2 + i
+                r = g = b = 0
+                for dx, dy in offsets:
+                    c, _ = _primary_sample(scene, camera, O, x + dx, y - dy, depth, roulette)
+                    r += c[0]
+                    g += c[1]
+                    b += c[2]
+                count = len(offsets)
+                color = (round(r / count), round(g / count), round(b / count))
+            tile[k:k + 3] = color
+            k += 3
+
+    return tile
+
+
+PROGRESSIVE_STEPS = (8, 4, 2, 1)
+
+
+def upscale_samples(samples, step):
+    """
+    Preview of a partially rendered image: each pixel takes the color of the sample
+    at the top-left corner of its step x step block.
+    """
+    width, height = samples.width, samples.height
+    preview = Framebuffer(width, height)
+    for y in range(0, height, step):
+        src = samples.row(y)
+        row = preview.row(y)
+        for x in range(0, width, step):
+            n = min(step, width - x)
+            row[3 * x:3 * (x + n)] = bytes(src[3 * x:3 * x + 3]) * n
+        for dy in range(1, min(step, height - y)):
+            preview.row(y + dy)[:] = row
+    return preview
+
+
+def render_progressive(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, steps=PROGRESSIVE_STEPS, callback=None,
+                       depth=REFLECTION_DEPTH, fov=None, roulette=False):
+    """
+    Render the image in passes of decreasing step. Each pass traces the pixels of the
+    step-spaced grid that no earlier pass traced, then calls callback(preview, step)
+    with the upscaled image. Returns the image of the last pass: with a last step of 1
+    it is exactly the output of render_image.
+    """
+    camera = Camera(width, height, fov)
+    samples = Framebuffer(width, height)
+    done = bytearray(width * height)
+    O = Vector(0, 0, 0)
+    image = samples
+
+    for step in steps:
+        for j in range(0, height, step):
+            for i in range(0, width, step):
+                if done[j * width + i]:
+                    continue
+                D = camera.direction(i, j)
+                samples.set_pixel(i, j, trace_ray(O, D, 1.0, INF, scene, depth, roulette=roulette))
+                done[j * width + i] = 1
+
+        image = samples if step == 1 else upscale_samples(samples, step)
+        if callback is not None:
+            callback(image, step)
+
+    return image
+
+
+def build_gbuffer(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, fov=None):
+    """
+    Primary visibility of every pixel, row by row: None for the background, otherwise
+    (object, P, N, D, base_color). Valid as long as the geometry and camera do not move.
+    """
+    camera = Camera(width, height, fov)
+    gbuffer = []
+    O = Vector(0, 0, 0)
+
+    for j in range(height):
+        for i in range(width):
+            D = camera.direction(i, j)
+            RENDER_STATS["rays"] += 1
+            t, obj, object_type = closest_intersection(O, D, 1.0, INF, scene)
+            if obj is None:
+                gbuffer.append(None)
+            else:
+                P, N, base_color = surface_at(O, D, t, obj, object_type)
+                gbuffer.append((obj, P, N, D, base_color))
+
+    return gbuffer
+
+
+def shade_gbuffer(gbuffer, scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, depth=REFLECTION_DEPTH, roulette=False):
+    """Render a frame from a G-buffer: only lighting and reflections are evaluated"""
+    image = Framebuffer(width, height)
+    k = 0
+
+    for entry in gbuffer:
+        if entry is None:
+            color = BACKGROUND_COLOR
+        else:
+            obj, P, N, D, base_color = entry
+            color = shade(P, N, D, obj, base_color, scene, depth, roulette=roulette)
+        image[k:k + 3] = color
+        k += 3
+
+    return image
+
+
+class GBufferRenderer:
+    """
+    Render function for animations where only the lights move.
+    The G-buffer is built on the first frame rendered (in each worker process)
+    and later frames only re-evaluate compute_lighting and reflections. It is
+    built again if a frame asks for another scene or image size.
+    """
+
+    def __init__(self, depth=REFLECTION_DEPTH, fov=None, roulette=False):
+        self.gbuffer = None
+        self.built_for = None   # (scène, largeur, hauteur) du G-buffer
+        self.depth = depth
+        self.fov = fov
+        self.roulette = roulette
+
+    def __call__(self, scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+        built_for = self.built_for
+        if self.gbuffer is None or built_for[0] is not scene or built_for[1:] != (width, height):
+            self.gbuffer = build_gbuffer(scene, width, height, self.fov)
+            self.built_for = (scene, width, height)
+        return shade_gbuffer(self.gbuffer, scene, width, height, self.depth, self.roulette)
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The numpy engine requires NumPy (pip install numpy)")
+
+
+def _dot_np(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _normalize_np(v):
+    """Batched Vector.normalize: v is a tuple (x, y, z) of arrays"""
+    l = np.sqrt(_dot_np(v, v))
+    zero = l == 0
+    l = np.where(zero, 1.0, l)
+    return (
+        np.where(zero, 0.0, v[0] / l),
+        np.where(zero, 0.0, v[1] / l),
+        np.where(zero, 0.0, v[2] / l),
+    )
+
+
+NUMPY_BATCH_ELEMENTS = 1 << 20
+
+
+def _column_np(c):
+    """(n,) array as an (n, 1) column, to broadcast rays against objects; scalars unchanged"""
+    if isinstance(c, np.ndarray) and c.ndim == 1:
+        return c[:, None]
+    return c
+
+
+def intersect_rays_spheres(O, D, center, r2):
+    """
+    Batched version of intersect_ray_sphere, for n rays against K spheres at once.
+    O, D: tuples (x, y, z) of (n, 1) columns or floats
+    center: tuple (x, y, z) of arrays of shape (K,), r2: squared radii, shape (K,)
+    Returns arrays (t1, t2) of shape (n, K), INF where the rays miss.
+    """
+    CO = (O[0] - center[0], O[1] - center[1], O[2] - center[2])
+
+    a = _dot_np(D, D)
+    b = 2 * _dot_np(CO, D)
+    c = _dot_np(CO, CO) - r2
+    discriminant = b * b - 4 * a * c
+    hit = discriminant >= 0
+
+    sqrt_disc = np.sqrt(np.where(hit, discriminant, 0.0))
+    t1 = np.where(hit, (-b + sqrt_disc) / (2 * a), INF)
+    t2 = np.where(hit, (-b - sqrt_disc) / (2 * a), INF)
+
+    return t1, t2
+
+
+def intersect_rays_plane(O, D, plane):
+    """Batched version of intersect_ray_plane"""
+    n = plane.normal
+    p = plane.point
+    denom = n.x * D[0] + n.y * D[1] + n.z * D[2]
+    valid = np.abs(denom) >= 1e-6
+
+    num = (p.x - O[0]) * n.x + (p.y - O[1]) * n.y + (p.z - O[2]) * n.z
+    t = num / np.where(valid, denom, 1.0)
+    return np.where(valid & (t > 0), t, INF)
+
+
+def intersect_rays_triangles(O, D, v0, edge1, edge2):
+    """
+    Batched version of intersect_ray_triangle (Moller-Trumbore), n rays against K triangles.
+    O, D: as for intersect_rays_spheres; v0, edge1, edge2: tuples of arrays of shape (K,)
+    Returns an array of shape (n, K), INF where the rays miss.
+    """
+    EPSILON = 1e-6
+
+    h = (
+        D[1] * edge2[2] - D[2] * edge2[1],
+        D[2] * edge2[0] - D[0] * edge2[2],
+        D[0] * edge2[1] - D[1] * edge2[0],
+    )
+    a = edge1[0] * h[0] + edge1[1] * h[1] + edge1[2] * h[2]
+    ok = (a <= -EPSILON) | (a >= EPSILON)
+
+    f = 1.0 / np.where(ok, a, 1.0)
+    s = (O[0] - v0[0], O[1] - v0[1], O[2] - v0[2])
+    u = f * _dot_np(s, h)
+    ok = ok & (u >= 0.0) & (u <= 1.0)
+
+    q = (
+        s[1] * edge1[2] - s[2] * edge1[1],
+        s[2] * edge1[0] - s[0] * edge1[2],
+        s[0] * edge1[1] - s[1] * edge1[0],
+    )
+    v = f * _dot_np(D, q)
+    ok = ok & (v >= 0.0) & (u + v <= 1.0)
+
+    t = f * (edge2[0] * q[0] + edge2[1] * q[1] + edge2[2] * q[2])
+    return np.where(ok & (t > EPSILON), t, INF)
+
+
+def _scene_objects(scene):
+    """Flat list of (type, object) in the order trace_ray visits them"""
+    return (
+        [("plane", p) for p in scene.Planes]
+        + [("sphere", s) for s in scene.Spheres]
+        + [("triangle", t) for t in scene.Triangles]
+    )
+
+
+class SceneArrays:
+    """
+    The objects of a scene as NumPy columns for the batched engine, indexed like
+    _scene_objects (planes, then spheres, then triangles): each stage handles all
+    the objects of a kind at once. Built by scene_arrays(), dropped by compile_scene().
+    """
+
+    def __init__(self, scene):
+        def columns(vectors):
+            return tuple(np.array([getattr(v, a) for v in vectors], dtype=float) for a in "xyz")
+
+        self.objects = _scene_objects(scene)
+        self.planes = scene.Planes
+        self.sphere_start = len(scene.Planes)
+        self.triangle_start = self.sphere_start + len(scene.Spheres)
+
+        spheres, triangles = scene.Spheres, scene.Triangles
+        self.sphere_center = columns([s.center for s in spheres])
+        self.sphere_r2 = np.array([s.radius * s.radius for s in spheres], dtype=float)
+        self.triangle_v0 = columns([t.v0 for t in triangles])
+        self.triangle_edge1 = columns([t.v1 - t.v0 for t in triangles])
+        self.triangle_edge2 = columns([t.v2 - t.v0 for t in triangles])
+
+        # Matériau de chaque objet ; la normale ne sert que pour les plans et les triangles
+        objects = [obj for kind, obj in self.objects]
+        zero = Vector(0, 0, 0)
+        self.normal = columns([zero if kind == "sphere" else obj.normal for kind, obj in self.objects])
+        self.specular = np.array([obj.specular for obj in objects], dtype=float)
+        self.reflective = np.array([obj.reflective for obj in objects], dtype=float)
+        self.color = np.array([(0, 0, 0) if obj.texture else obj.color for obj in objects],
+                              dtype=np.int64).reshape(-1, 3)
+
+        # Files de matériaux texturés : (texture, indices des objets qui l'utilisent)
+        textures = {}
+        for k, obj in enumerate(objects):
+            if obj.texture:
+                textures.setdefault(id(obj.texture), (obj.texture, []))[1].append(k)
+        self.textures = [(texture, np.array(ks)) for texture, ks in textures.values()]
+
+
+def scene_arrays(scene):
+    """SceneArrays of the scene, built on first use and kept until the next compile_scene"""
+    if scene.NumpyArrays is None:
+        scene.NumpyArrays = SceneArrays(scene)
+    return scene.NumpyArrays
+
+
+def _batches(count, n):
+    """Ranges of objects to test at once against n rays, bounded by NUMPY_BATCH_ELEMENTS"""
+    step = max(1, NUMPY_BATCH_ELEMENTS // max(n, 1))
+    for start in range(0, count, step):
+        yield start, min(start + step, count)
+
+
+def closest_hits_numpy(O, D, t_min, t_max, table):
+    """
+    Batched version of closest_intersection over the objects of table (SceneArrays).
+    Returns (closest_t, closest): INF and -1 for the rays that hit nothing.
+    Ties go to the first object in scene order, as in closest_intersection.
+    """
+    n = len(D[0])
+    closest_t = np.full(n, INF)
+    closest = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return closest_t, closest
+
+    for k, plane in enumerate(table.planes):
+        t = intersect_rays_plane(O, D, plane)
+        m = (t_min <= t) & (t <= t_max) & (t < closest_t)
+        closest_t = np.where(m, t, closest_t)
+        closest[m] = k
+
+    Oc, Dc = tuple(map(_column_np, O)), tuple(map(_column_np, D))
+    rows = np.arange(n)
+
+    def keep_closest(t, first, per_object):
+        # t: candidats (n, K * per_object) dans l'ordre de la boucle de closest_intersection
+        nonlocal closest_t
+        t = np.where((t_min <= t) & (t <= t_max), t, INF)
+        best = np.argmin(t, axis=1)
+        best_t = t[rows, best]
+        m = best_t < closest_t
+        closest_t = np.where(m, best_t, closest_t)
+        closest[m] = first + best[m] // per_object
+
+    for start, stop in _batches(table.triangle_start - table.sphere_start, n):
+        center = tuple(c[start:stop] for c in table.sphere_center)
+        t1, t2 = intersect_rays_spheres(Oc, Dc, center, table.sphere_r2[start:stop])
+        # t1 puis t2 de chaque sphère
+        keep_closest(np.stack((t1, t2), axis=2).reshape(n, -1), table.sphere_start + start, 2)
+
+    for start, stop in _batches(len(table.objects) - table.triangle_start, n):
+        t = intersect_rays_triangles(Oc, Dc, tuple(c[start:stop] for c in table.triangle_v0),
+                                     tuple(c[start:stop] for c in table.triangle_edge1),
+                                     tuple(c[start:stop] for c in table.triangle_edge2))
+        keep_closest(t, table.triangle_start + start, 1)
+
+    return closest_t, closest
+
+
+def shadow_hits_numpy(P, L_dir, t_max, table, current):
+    """
+    Batched shadow test: True for the rays from P towards L_dir blocked before t_max
+    by a sphere or triangle other than current (the object hit, per ray).
+    """
+    n = len(current)
+    blocked = np.zeros(n, dtype=bool)
+    Pc, Lc, tm = tuple(map(_column_np, P)), tuple(map(_column_np, L_dir)), _column_np(t_max)
+    own = current[:, None]
+
+    first = table.sphere_start
+    for start, stop in _batches(table.triangle_start - first, n):
+        center = tuple(c[start:stop] for c in table.sphere_center)
+        t1, t2 = intersect_rays_spheres(Pc, Lc, center, table.sphere_r2[start:stop])
+        hit = ((0.001 < t1) & (t1 < tm)) | ((0.001 < t2) & (t2 < tm))
+        blocked |= (hit & (own != np.arange(first + start, first + stop))).any(axis=1)
+
+    first = table.triangle_start
+    for start, stop in _batches(len(table.objects) - first, n):
+        t = intersect_rays_triangles(Pc, Lc, tuple(c[start:stop] for c in table.triangle_v0),
+                                     tuple(c[start:stop] for c in table.triangle_edge1),
+                                     tuple(c[start:stop] for c in table.triangle_edge2))
+        hit = (0.001 < t) & (t < tm)
+        blocked |= (hit & (own != np.arange(first + start, first + stop))).any(axis=1)
+
+    return blocked
+
+
+def compute_lighting_numpy(P, N, V, s, scene, table, current):
+    """
+    Batched version of compute_lighting.
+    P, N, V: tuples of arrays, s: array of specular coefficients
+    table: SceneArrays of the scene, current: index of the hit object per ray
+    The shadow rays of each light are tested as one batch (shadow_hits_numpy).
+    """
+    i = np.zeros(len(s))
+    V_length = np.sqrt(_dot_np(V, V))
+
+    for light in scene.Lights:
+        if light.type == "ambient":
+            i = i + light.intensity
+            continue
+
+        if light.type == "point":
+            pos = light.position
+            L = (pos.x - P[0], pos.y - P[1], pos.z - P[2])
+            t_max = np.sqrt(_dot_np(L, L))
+        else:
+            Ld = light.direction.normalize() * (-1)
+            L = (Ld.x, Ld.y, Ld.z)
+            t_max = INF
+
+        L_dir = _normalize_np(L)
+
+        RENDER_STATS["shadow_rays"] += len(s)
+        RENDER_STATS["shadow_tests"] += len(s) * (len(table.objects) - table.sphere_start)
+        lit = ~shadow_hits_numpy(P, L_dir, t_max, table, current)
+
+        n_dot_l = _dot_np(N, L_dir)
+        i = np.where(lit & (n_dot_l > 0), i + light.intensity * n_dot_l, i)
+
+        if light.type == "point":
+            distance = np.sqrt(_dot_np(L, L))
+            attenuation = 1 / (1 + 0.1 * distance + 0.01 * distance * distance)
+            i = np.where(lit, i + light.intensity * n_dot_l * attenuation, i)
+
+        spec = lit & (s != -1) & (s > 0) & (n_dot_l > 0)
+        if spec.any():
+            R = (
+                N[0] * (2 * n_dot_l) - L_dir[0],
+                N[1] * (2 * n_dot_l) - L_dir[1],
+                N[2] * (2 * n_dot_l) - L_dir[2],
+            )
+            r_dot_v = _dot_np(R, V)
+            spec &= r_dot_v > 0
+            R_length = np.sqrt(_dot_np(R, R))
+            ratio = r_dot_v[spec] / (R_length[spec] * V_length[spec])
+            i[spec] += light.intensity * np.power(ratio, s[spec])
+
+    return i
+
+
+def _texture_colors_numpy(texture, u, v):
+    if isinstance(texture, CheckerTexture):
+        even = (u * texture.scale).astype(np.int64) % 2 == (v * texture.scale).astype(np.int64) % 2
+        return np.where(even[:, None], texture.color1, texture.color2)
+    return np.array([texture.get_color(a, b) for a, b in zip(u, v)])
+
+
+def shade_hits_numpy(O, D, closest_t, closest, hits, scene, table):
+    """
+    Shading stage of the batched engine for the rays hits (indices into O, D):
+    normals and materials are gathered from table for all the rays at once, the
+    textured ones are handled in one queue per texture, then lighting is computed
+    for the whole batch. Returns (P, N, D, local_color, reflective) of those rays.
+    """
+    n = len(D[0])
+    current = closest[hits]
+    t = closest_t[hits]
+    D = tuple(np.broadcast_to(c, (n,))[hits] for c in D)
+    O = tuple(np.broadcast_to(c, (n,))[hits] for c in O)
+
+    P = (O[0] + D[0] * t, O[1] + D[1] * t, O[2] + D[2] * t)
+    V = (D[0] * (-1), D[1] * (-1), D[2] * (-1))
+
+    N = [c[current] for c in table.normal]
+    specular = table.specular[current]
+    reflective = table.reflective[current]
+    base_color = table.color[current]
+
+    sphere = (current >= table.sphere_start) & (current < table.triangle_start)
+    center = table.sphere_center
+    if sphere.any():
+        k = current[sphere] - table.sphere_start
+        Nk = _normalize_np((P[0][sphere] - center[0][k], P[1][sphere] - center[1][k], P[2][sphere] - center[2][k]))
+        for axis in range(3):
+            N[axis][sphere] = Nk[axis]
+
+    for texture, ks in table.textures:
+        m = np.isin(current, ks)
+        if not m.any():
+            continue
+        u = np.zeros(np.count_nonzero(m))
+        v = np.zeros(len(u))
+        on_sphere = sphere[m]
+        if on_sphere.any():
+            rows = m & sphere
+            k = current[rows] - table.sphere_start
+            p = _normalize_np((P[0][rows] - center[0][k], P[1][rows] - center[1][k], P[2][rows] - center[2][k]))
+            u[on_sphere] = 0.5 + np.arctan2(p[2], p[0]) / (2 * math.pi)
+            v[on_sphere] = 0.5 - np.arcsin(p[1]) / math.pi
+        base_color[m] = _texture_colors_numpy(texture, u, v)
+
+    flip = _dot_np(N, D) > 0
+    N = tuple(np.where(flip, -c, c) for c in N)
+
+    lighting = compute_lighting_numpy(P, N, V, specular, scene, table, current)
+    lighting = np.maximum(0, np.minimum(1, lighting))
+
+    local_color = (base_color * lighting[:, None]).astype(np.int64)
+    return P, N, D, local_color, reflective
+
+
+def trace_rays_numpy(O, D, t_min, t_max, scene, depth=REFLECTION_DEPTH, table=None,
+                     min_weight=REFLECTION_MIN_WEIGHT):
+    """
+    Batched version of trace_ray, run in stages over arrays of rays: closest hits,
+    shading (shade_hits_numpy, with the shadow rays of each light in one batch), then
+    the reflection rays of the reflective hits as the next batch, up to depth and
+    while their weight in the pixel is at least min_weight, as in shade.
+    O: tuple of arrays or floats, D: tuple of arrays (one entry per ray)
+    Returns an int array of shape (n, 3) with the color of each ray.
+    """
+    if table is None:
+        table = scene_arrays(scene)
+
+    # Un niveau par rebond : (nombre de rayons, rayons touchés, couleur locale, rayons réfléchis, coefficients)
+    levels = []
+    weight = np.ones(len(D[0]))
+    while True:
+        n = len(D[0])
+        RENDER_STATS["rays"] += n
+        closest_t, closest = closest_hits_numpy(O, D, t_min, t_max, table)
+        hits = np.nonzero(closest >= 0)[0]
+        if len(hits) == 0:
+            levels.append((n, hits, None, None, None))
+            break
+
+        P, N, D, local_color, reflective = shade_hits_numpy(O, D, closest_t, closest, hits, scene, table)
+        next_weight = weight[hits] * reflective
+        bounce = np.nonzero((reflective > 0) & (next_weight >= min_weight))[0] if depth > 0 else hits[:0]
+        levels.append((n, hits, local_color, bounce, reflective[bounce][:, None]))
+        if len(bounce) == 0:
+            break
+        RENDER_STATS["reflection_rays"] += len(bounce)
+        weight = next_weight[bounce]
+
+        Db = tuple(c[bounce] for c in D)
+        Nb = tuple(c[bounce] for c in N)
+        d_dot_n = _dot_np(Db, Nb)
+        D = _normalize_np(tuple(Db[a] - Nb[a] * (2 * d_dot_n) for a in range(3)))
+        O = tuple(P[a][bounce] + Nb[a] * 0.001 for a in range(3))
+        t_min, t_max = 0.001, INF
+        depth -= 1
+
+    # Mélange du dernier rebond vers le premier, avec la même troncature qu'en récursif
+    reflected = None
+    for n, hits, local_color, bounce, r in reversed(levels):
+        colors = np.zeros((n, 3), dtype=np.int64)
+        if len(hits):
+            colors[hits] = local_color
+            if reflected is not None:
+                colors[hits[bounce]] = (local_color[bounce] * (1 - r) + reflected * r).astype(np.int64)
+        reflected = colors
+    return reflected
+
+
+def render_tile_numpy(scene, x0, x1, y0, y1, camera=None, depth=REFLECTION_DEPTH):
+    """NumPy version of render_tile"""
+    _require_numpy()
+    if camera is None:
+        camera = Camera()
+
+    vx, vy = np.meshgrid(np.array(camera.columns[x0:x1]), np.array(camera.rows[y0:y1]))
+    D = _normalize_np((vx.ravel(), vy.ravel(), np.full(vx.size, camera.distance)))
+    O = (0, 0, 0)
+
+    colors = trace_rays_numpy(O, D, 1.0, INF, scene, depth)
+
+    return Framebuffer(x1 - x0, y1 - y0, colors.astype(np.uint8).tobytes())
+
+
+NUMPY_BAND_HEIGHT = 32
+
+
+def render_image_numpy(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, depth=REFLECTION_DEPTH, fov=None):
+    """
+    Render scene with the batched NumPy engine, same output as render_image.
+    The canvas is traced in bands of rows to bound the size of the ray arrays.
+    """
+    camera = Camera(width, height, fov)
+    image = Framebuffer(width, height)
+    for y0 in range(0, height, NUMPY_BAND_HEIGHT):
+        band = render_tile_numpy(scene, 0, width, y0, min(y0 + NUMPY_BAND_HEIGHT, height), camera, depth)
+        image.paste(band, 0, y0)
     return image
 
 
-def save_ppm(image, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, filename='output.ppm'):
-    """Save image to PPM file"""
-    with open(filename, 'w') as f:
-        f.write(f"P3\n{width} {height}\n255\n")
-        for row in image:
-            for pixel in row:
-                f.write(f"{pixel[0]} {pixel[1]} {pixel[2]} ")
-            f.write("\n")
+def render_rows(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, tile_renderer=render_tile, band_height=1, fov=None):
+    """
+    Render the image as a generator of rows (memoryviews of RGB bytes), from top to bottom.
+    Rows are rendered band_height at a time, so save_ppm can write them as they finish.
+    """
+    camera = Camera(width, height, fov)
+    for y0 in range(0, height, band_height):
+        y1 = min(y0 + band_height, height)
+        yield from tile_renderer(scene, 0, width, y0, y1, camera).rows()
+
+
+TILE_SIZE = 32
+
+_worker_scene = None
+
+
+def _init_tile_worker(scene):
+    """Runs once in each worker process: keep the scene for all its tiles"""
+    global _worker_scene
+    _worker_scene = scene
+
+
+def _render_tile_worker(args):
+    tile_renderer, x0, x1, y0, y1, camera = args
+    reset_render_stats()
+    tile = tile_renderer(_worker_scene, x0, x1, y0, y1, camera)
+    return tile, dict(RENDER_STATS)
+
+
+def render_image_tiled(scene, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, workers=None,
+                       tile_size=TILE_SIZE, engine="python", tile_renderer=None, fov=None):
+    """
+    Render scene on a pool of processes, one tile at a time.
+    The scene is sent once to each worker; the output is identical to render_image.
+    tile_renderer, if given, replaces the renderer of the engine (it must be picklable).
+    """
+    if tile_renderer is None:
+        tile_renderer = render_tile_numpy if engine == "numpy" else render_tile
+    camera = Camera(width, height, fov)
+    tiles = [
+        (tile_renderer, x0, min(x0 + tile_size, width), y0, min(y0 + tile_size, height), camera)
+        for y0 in range(0, height, tile_size)
+        for x0 in range(0, width, tile_size)
+    ]
+    image = Framebuffer(width, height)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_tile_worker,
+                             initargs=(scene,)) as executor:
+        for args, (tile, stats) in zip(tiles, executor.map(_render_tile_worker, tiles)):
+            image.paste(tile, args[1], args[3])
+            add_render_stats(stats)
+
+    return image
+
+
+def render_animation_frame(scene, scene_name, initial_centers, frame, total_frames, render=render_image,
+                           width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+    """Set up and render one frame of the animation; returns it as a Framebuffer"""
+    angle = setup_animation_frame(scene, scene_name, initial_centers, frame, total_frames)
+    print(f"Rendering frame {frame+1}/{total_frames} (angle={angle:.1f})")
+    reset_render_stats()
+    image = render(scene, width, height)
+    if not isinstance(image, Framebuffer):
+        image = Framebuffer(width, height, b"".join(image))
+    report_render_stats()
+    return image
+
+
+_worker_animation = None
+
+
+def _init_animation_worker(scene, scene_name, initial_centers, total_frames, render, width, height):
+    """Runs once in each worker process: keep a private copy of the scene"""
+    global _worker_animation
+    _worker_animation = (scene, scene_name, initial_centers, total_frames, render, width, height)
+
+
+def _render_animation_worker(frame):
+    scene, scene_name, initial_centers, total_frames, render, width, height = _worker_animation
+    return render_animation_frame(scene, scene_name, initial_centers, frame, total_frames, render, width, height)
+
+
+def render_animation_parallel(scene, scene_name, initial_centers, total_frames, render=render_image,
+                              workers=None, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+    """
+    Render the frames of the animation on a pool of processes.
+    Each worker derives the frame state from the frame index; the frames are yielded
+    in order as Framebuffers, as soon as they are ready.
+    """
+    initargs = (scene, scene_name, initial_centers, total_frames, render, width, height)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_animation_worker,
+                             initargs=initargs) as executor:
+        yield from executor.map(_render_animation_worker, range(total_frames))
+
+
+def ppm_row_bytes(row):
+    """Binary (P6) encoding of one row: either RGB bytes already, or a list of (r, g, b)"""
+    if isinstance(row, (bytes, bytearray, memoryview)):
+        return row
+    return bytes([c for pixel in row for c in pixel])
+
+
+def save_ppm(image, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, filename='output.ppm', fmt="P3"):
+    """
+    Save image to PPM file, as ASCII (P3) or binary (P6).
+    image is a Framebuffer (written in a single call for P6), a list of rows, or any
+    iterable of rows (e.g. render_rows) which is then written as the rows are produced.
+    """
+    if isinstance(image, Framebuffer):
+        width, height = image.width, image.height
+
+    if fmt == "P6":
+        with open(filename, 'wb') as f:
+            f.write(f"P6\n{width} {height}\n255\n".encode("ascii"))
+            if isinstance(image, Framebuffer):
+                f.write(image)
+            elif isinstance(image, list):
+                data = bytearray()
+                for row in image:
+                    data += ppm_row_bytes(row)
+                f.write(data)
+            else:
+                for row in image:
+                    f.write(ppm_row_bytes(row))
+    elif fmt == "P3":
+        rows = image.rows() if isinstance(image, Framebuffer) else image
+        with open(filename, 'w') as f:
+            f.write(f"P3\n{width} {height}\n255\n")
+            for row in rows:
+                values = ppm_row_bytes(row)
+                f.write("".join([f"{values[k]} {values[k + 1]} {values[k + 2]} "
+                                 for k in range(0, len(values), 3)]) + "\n")
+    else:
+        raise ValueError(f"Unknown PPM format: {fmt} (expected P3 or P6)")
     print(f"Image saved to {filename}")
 
 
+ANIMATION_DELAY = 10  # centièmes de seconde entre deux images, comme convert -delay 10
+
+# Palette uniforme des GIF : 6 niveaux de rouge, 7 de vert, 6 de bleu (252 couleurs)
+GIF_LEVELS = (6, 7, 6)
+# Seuils du tramage ordonné (matrice de Bayer 4 x 4)
+_BAYER_4 = ((0, 8, 2, 10), (12, 4, 14, 6), (3, 11, 1, 9), (15, 7, 13, 5))
+
+
+def gif_palette():
+    """Global color table of the GIF: the GIF_LEVELS uniform palette, padded to 256 colors"""
+    r_levels, g_levels, b_levels = GIF_LEVELS
+    palette = bytearray()
+    for r in range(r_levels):
+        for g in range(g_levels):
+            for b in range(b_levels):
+                palette += bytes((round(r * 255 / (r_levels - 1)), round(g * 255 / (g_levels - 1)),
+                                  round(b * 255 / (b_levels - 1))))
+    return bytes(palette) + bytes(3 * (256 - len(palette) // 3))
+
+
+@functools.lru_cache(maxsize=None)
+def _dither_tables():
+    """
+    tables[y % 4][x % 4][channel]: bytes.translate tables mapping a channel value to its
+    dithered level, already multiplied by the weight of the channel in the palette index
+    """
+    r_levels, g_levels, b_levels = GIF_LEVELS
+    channels = ((r_levels, g_levels * b_levels), (g_levels, b_levels), (b_levels, 1))
+    return [
+        [
+            [bytes(weight * min(levels - 1, int(v * (levels - 1) / 255 + (threshold + 0.5) / 16))
+                   for v in range(256))
+             for levels, weight in channels]
+            for threshold in row
+        ]
+        for row in _BAYER_4
+    ]
+
+
+def quantize_row(row, y):
+    """Palette indices (bytes) of one RGB row of the image, with ordered dithering"""
+    tables = _dither_tables()[y % 4]
+    row = bytes(row)
+    indices = bytearray(len(row) // 3)
+    for phase in range(4):
+        tr, tg, tb = tables[phase]
+        r = row[3 * phase::12].translate(tr)
+        g = row[3 * phase + 1::12].translate(tg)
+        b = row[3 * phase + 2::12].translate(tb)
+        indices[phase::4] = bytes(map(operator.add, map(operator.add, r, g), b))
+    return indices
+
+
+class LzwEncoder:
+    """
+    GIF flavour of LZW: variable-length codes of 9 to 12 bits packed least significant
+    bit first, with a clear code whenever the table is full.
+    feed() can be called with successive pieces of the data; the bytes it returns
+    (and those of finish()) form the compressed stream.
+    """
+
+    def __init__(self, min_code_size=8):
+        self.min_code_size = min_code_size
+        self.clear_code = 1 << min_code_size
+        self.end_code = self.clear_code + 1
+        self.bits = 0
+        self.bit_count = 0
+        self.prefix = -1
+        self.out = bytearray()
+        self._reset()
+        self._emit(self.clear_code)
+
+    def _reset(self):
+        self.table = {}
+        self.next_code = self.end_code + 1
+        self.code_size = self.min_code_size + 1
+
+    def _emit(self, code):
+        self.bits |= code << self.bit_count
+        self.bit_count += self.code_size
+        while self.bit_count >= 8:
+            self.out.append(self.bits & 0xFF)
+            self.bits >>= 8
+            self.bit_count -= 8
+
+    def _take(self):
+        out = bytes(self.out)
+        self.out.clear()
+        return out
+
+    def feed(self, data):
+        # Boucle critique : l'état est copié dans des variables locales
+        table, prefix = self.table, self.prefix
+        next_code, code_size = self.next_code, self.code_size
+        bits, bit_count, out = self.bits, self.bit_count, self.out
+        for c in data:
+            if prefix < 0:
+                prefix = c
+                continue
+            key = (prefix << 8) | c
+            code = table.get(key)
+            if code is not None:
+                prefix = code
+                continue
+            bits |= prefix << bit_count
+            bit_count += code_size
+            if next_code == 4096:
+                # Table pleine : code clear (encore sur 12 bits) et nouvelle table
+                bits |= self.clear_code << bit_count
+                bit_count += code_size
+                table = {}
+                next_code = self.end_code + 1
+                code_size = self.min_code_size + 1
+            else:
+                table[key] = next_code
+                if next_code == 1 << code_size:
+                    code_size += 1
+                next_code += 1
+            while bit_count >= 8:
+                out.append(bits & 0xFF)
+                bits >>= 8
+                bit_count -= 8
+            prefix = c
+        self.table, self.prefix = table, prefix
+        self.next_code, self.code_size = next_code, code_size
+        self.bits, self.bit_count = bits, bit_count
+        return self._take()
+
+    def finish(self):
+        if self.prefix >= 0:
+            self._emit(self.prefix)
+            # Le décodeur ajoute une entrée en lisant ce dernier code : même changement de taille
+            if self.next_code < 4096 and self.next_code == 1 << self.code_size:
+                self.code_size += 1
+        self._emit(self.end_code)
+        if self.bit_count:
+            self.out.append(self.bits & 0xFF)
+            self.bits = self.bit_count = 0
+        return self._take()
+
+
+class AnimationWriter:
+    """
+    Base class of the animation encoders: frames are added one by one with add_frame()
+    and written as they come, so no frame is kept once encoded. Use as a context manager.
+    """
+
+    def __init__(self, filename, width, height, delay=ANIMATION_DELAY, loop=0):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.delay = delay
+        self.loop = loop
+        self.frames = 0
+        self.file = open(filename, 'wb')
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _rows(self, image):
+        """Rows of a Framebuffer or of any iterable of RGB byte rows (e.g. render_rows)"""
+        rows = image.rows() if isinstance(image, Framebuffer) else image
+        for row in rows:
+            row = ppm_row_bytes(row)
+            if len(row) != 3 * self.width:
+                raise ValueError(f"Frame row of {len(row)} bytes, expected {3 * self.width}")
+            yield row
+
+    def add_frame(self, image):
+        self._write_frame(image)
+        self.frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self._finish()
+            self.file.close()
+
+
+class GifWriter(AnimationWriter):
+    """Animated GIF encoder: uniform palette (gif_palette) with ordered dithering, LZW"""
+
+    def _start(self):
+        if not 0 < self.width < 65536 or not 0 < self.height < 65536:
+            raise ValueError(f"GIF images are limited to 65535x65535 pixels, got {self.width}x{self.height}")
+        f = self.file
+        f.write(b"GIF89a")
+        # Écran logique avec une table de couleurs globale de 256 entrées
+        f.write(struct.pack("<HHBBB", self.width, self.height, 0xF7, 0, 0))
+        f.write(gif_palette())
+        # Extension NETSCAPE2.0 : nombre de boucles (0 = infini)
+        f.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+
+    def _write_frame(self, image):
+        f = self.file
+        # Graphic Control Extension (délai), puis descripteur de l'image entière
+        f.write(b"\x21\xF9\x04\x04" + struct.pack("<H", self.delay) + b"\x00\x00")
+        f.write(b"\x2C" + struct.pack("<HHHHB", 0, 0, self.width, self.height, 0))
+        f.write(b"\x08")
+        encoder = LzwEncoder(8)
+        pending = bytearray()
+        y = 0
+        for row in self._rows(image):
+            pending += encoder.feed(quantize_row(row, y))
+            y += 1
+            pending = self._write_blocks(pending)
+        pending += encoder.finish()
+        self._write_blocks(pending, final=True)
+        if y != self.height:
+            raise ValueError(f"Frame of {y} rows, expected {self.height}")
+
+    def _write_blocks(self, data, final=False):
+        """Write data as sub-blocks of 255 bytes; returns the incomplete rest (everything if final)"""
+        f = self.file
+        full = len(data) - len(data) % 255
+        view = memoryview(data)
+        for start in range(0, full, 255):
+            f.write(b"\xFF" + view[start:start + 255])
+        rest = bytearray(view[full:])
+        view.release()
+        if final:
+            if rest:
+                f.write(bytes((len(rest),)) + rest)
+            f.write(b"\x00")
+        return rest
+
+    def _finish(self):
+        self.file.write(b"\x3B")
+
+
+class ApngWriter(AnimationWriter):
+    """Animated PNG encoder: lossless 8-bit RGB frames compressed with zlib"""
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data
+                        + struct.pack(">I", zlib.crc32(kind + data)))
+
+    def _actl(self):
+        return struct.pack(">II", self.frames, self.loop)
+
+    def _start(self):
+        self.sequence = 0
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0))
+        # Le nombre de frames n'est connu qu'à la fin : acTL est réécrit par close()
+        self.actl_offset = self.file.tell()
+        self._chunk(b"acTL", self._actl())
+
+    def _write_frame(self, image):
+        self._chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, self.width, self.height, 0, 0,
+                                         self.delay, 100, 0, 0))
+        self.sequence += 1
+        compressor = zlib.compressobj(6)
+        data = bytearray()
+        y = 0
+        for row in self._rows(image):
+            # Filtre 0 (aucun) devant chaque ligne
+            data += compressor.compress(b"\x00")
+            data += compressor.compress(row)
+            y += 1
+        data += compressor.flush()
+        if y != self.height:
+            raise ValueError(f"Frame of {y} rows, expected {self.height}")
+        # La première frame est aussi l'image par défaut (IDAT), les suivantes sont des fdAT
+        if self.frames == 0:
+            self._chunk(b"IDAT", bytes(data))
+        else:
+            self._chunk(b"fdAT", struct.pack(">I", self.sequence) + data)
+            self.sequence += 1
+
+    def _finish(self):
+        self._chunk(b"IEND", b"")
+        self.file.seek(self.actl_offset)
+        self._chunk(b"acTL", self._actl())
+
+
 def main():
     parser = argparse.ArgumentParser(description="Raytracer Python")
     parser.add_argument("--animate", action="store_true", help="Activer le mode animation")
     parser.add_argument("--frames", type=int, default=36, help="Nombre de frames pour l'animation (défaut: 36)")
     parser.add_argument("--scene", choices=["sphere", "triangle", "move"], default="sphere", help="Choisir la scène à afficher")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python", help="Moteur de rendu : python (pixel par pixel) ou numpy (rayons par lots)")
+    parser.add_argument("--ppm-format", choices=["P3", "P6"], default="P6", help="Format des fichiers PPM : P3 (ASCII) ou P6 (binaire, défaut)")
+    parser.add_argument("--animation-format", choices=["gif", "apng"], default="gif", help="Format de l'animation : gif (animation.gif, 252 couleurs tramées, défaut) ou apng (animation.png, sans perte)")
+    parser.add_argument("--no-gbuffer", action="store_true", help="Animation : recalculer la visibilité primaire à chaque frame")
+    parser.add_argument("--workers", type=int, default=1, help="Nombre de processus pour le rendu par tuiles (défaut: 1, 0 = tous les coeurs)")
+    parser.add_argument("--aa", type=int, default=1, metavar="N", help="Anti-crénelage adaptatif : jusqu'à N rayons par pixel sur les contours (défaut: 1, désactivé)")
+    parser.add_argument("--aa-threshold", type=int, default=AA_THRESHOLD, help=f"Écart de couleur entre pixels voisins (0-255) au-delà duquel un pixel est suréchantillonné (défaut: {AA_THRESHOLD})")
+    parser.add_argument("--depth", type=int, default=REFLECTION_DEPTH, help=f"Nombre maximal de réflexions par rayon (défaut: {REFLECTION_DEPTH})")
+    parser.add_argument("--roulette", action="store_true", help=f"Roulette russe sur les réflexions au-delà du rebond {ROULETTE_DEPTH} : moins de rayons, image bruitée (moteur python)")
+    parser.add_argument("--progressive", action="store_true", help="Image seule : rendu en passes de plus en plus fines (1/8, 1/4, 1/2, pleine résolution), chaque aperçu étant écrit dans output.ppm")
+    parser.add_argument("--cache", action="store_true", help="Charger la scène depuis un cache binaire (<scène>.cache), reconstruit si le fichier change")
+    parser.add_argument("--width", type=int, default=CANVAS_WIDTH, help=f"Largeur de l'image en pixels (défaut: {CANVAS_WIDTH})")
+    parser.add_argument("--height", type=int, default=CANVAS_HEIGHT, help=f"Hauteur de l'image en pixels (défaut: {CANVAS_HEIGHT})")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None, metavar="TRACE", help="Mesurer le temps de chaque phase du rendu (rapport par frame) et écrire une trace Chrome (défaut: profile.json)")
+    parser.add_argument("--fov", type=float, default=None, help="Champ de vision vertical en degrés (défaut: 90, viewport de hauteur 2 à distance 1)")
     
     args = parser.parse_args()
+    if args.depth < 0:
+        parser.error("--depth must be >= 0")
+    if args.width < 1 or args.height < 1:
+        parser.error("--width and --height must be >= 1")
+    if args.fov is not None and not 0 < args.fov < 180:
+        parser.error("--fov must be between 0 and 180 degrees")
+    if args.profile and args.workers != 1:
+        parser.error("--profile measures a single process: use it with --workers 1")
+
+    # Les fonctions mesurées sont remplacées avant que le rendu ne les référence
+    profiler = None
+    if args.profile:
+        profiler = Profiler()
+        profiler.install()
+    antialias = args.aa >= 4
+    if antialias and args.engine != "python":
+        parser.error("--aa is only available with the python engine")
+    if args.roulette and args.engine != "python":
+        parser.error("--roulette is only available with the python engine")
+    if args.progressive and (args.animate or args.engine != "python" or antialias or args.workers != 1):
+        parser.error("--progressive renders a single image with the python engine, on one process, without --aa")
+
+    # Rendu ligne par ligne : save_ppm écrit chaque ligne dès qu'elle est prête
+    if args.engine == "numpy":
+        _require_numpy()
+        tile_renderer = functools.partial(render_tile_numpy, depth=args.depth)
+        band_height = NUMPY_BAND_HEIGHT
+    elif antialias:
+        tile_renderer = functools.partial(render_tile_adaptive, max_samples=args.aa, threshold=args.aa_threshold,
+                                          depth=args.depth, roulette=args.roulette)
+        band_height = AA_BAND_HEIGHT
+    else:
+        tile_renderer = functools.partial(render_tile, depth=args.depth, roulette=args.roulette)
+        band_height = 1
+    base_render = functools.partial(render_rows, tile_renderer=tile_renderer, band_height=band_height, fov=args.fov)
+    render = base_render
+
+    # Seule la lumière bouge : la visibilité primaire est calculée une fois puis réutilisée
+    if args.animate and args.scene != "move" and args.engine == "python" and not args.no_gbuffer \
+            and not antialias:
+        base_render = GBufferRenderer(args.depth, args.fov, args.roulette)
+        render = base_render
+
+    # En mode animation les processus se partagent les frames, sinon les tuiles d'une image
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+    if workers != 1 and not args.animate:
+        render = functools.partial(render_image_tiled, workers=workers, engine=args.engine,
+                                   tile_renderer=tile_renderer, fov=args.fov)
 
     print("Creating scene...")
     if args.scene == "triangle":
-        scene = create_triangle_scene()
+        scene = create_triangle_scene(args.cache)
         print(f"Triangle scene created with {len(scene.Triangles)} triangle(s)")
     elif args.scene == "move":
-        scene = create_scene_moove()
+        scene = create_scene_moove(args.cache)
         print(f"Scene created with {len(scene.Spheres)} spheres and {len(scene.Lights)} lights")
     elif args.scene == "sphere":
-        scene = create_scene()
+        scene = create_scene(args.cache)
         print(f"Scene created with {len(scene.Spheres)} spheres and {len(scene.Lights)} lights")
 
     if args.animate:
         nb_frames = args.frames
-        radius = 5
-        height = 3
 
         initial_centers = []
         if args.scene == "move":
@@ -640,78 +3469,67 @@ def main():
         
         print(f"Starting animation with {nb_frames} frames...")
 
-        for i in range(nb_frames):
-            angle = (360 / nb_frames) * i
-
-            if len(scene.Lights) > 1:
-                if args.scene == "move" and len(scene.Spheres) > 0:
-                    animate_spheres(scene, initial_centers, i, nb_frames)
-                if len(scene.Spheres) > 0:
-                    center = scene.Spheres[0].center
-                elif len(scene.Triangles) > 0:
-                    cx = sum(t.v0.x + t.v1.x + t.v2.x for t in scene.Triangles) / (3 * len(scene.Triangles))
-                    cy = sum(t.v0.y + t.v1.y + t.v2.y for t in scene.Triangles) / (3 * len(scene.Triangles))
-                    cz = sum(t.v0.z + t.v1.z + t.v2.z for t in scene.Triangles) / (3 * len(scene.Triangles))
-                    center = Vector(cx, cy, cz)
-                else:
-                    center = Vector(0, 0, 5)
-
-                if args.scene != "move":
-                    scene.Lights[1].position = orbit_light(
-                    center,
-                    radius=radius,
-                    angle_deg=angle,
-                    height=height
-                ) 
-
-            print(f"Rendering frame {i+1}/{nb_frames} (angle={angle:.1f})")
-            image = render_image(scene)
-
-            filename = f"frame_{i:02d}.ppm"
-            save_ppm(image, filename=filename)
-            
-        print("Rendering complete. Generating GIF...")
-
-        if sys.platform.startswith('linux'):
-            command = "convert -delay 10 -loop 0 frame_*.ppm animation.gif"
+        if args.animation_format == "apng":
+            filename, writer_class = "animation.png", ApngWriter
         else:
-            magick_path = r"C:\Program Files\ImageMagick-7.1.2-Q16-HDRI\magick.exe"
-            command = f'"{magick_path}" -delay 10 -loop 0 "frame_*.ppm" animation.gif'
-
-        try:
-            subprocess.run(command, shell=True, check=True)
-            print("------------------------------------------------")
-            print("SUCCESS: Animation saved as 'animation.gif'")
-            print("------------------------------------------------")
-            print("Cleaning up temporary .ppm files...")
-            if sys.platform.startswith('linux'):
-                subprocess.run("rm frame_*.ppm", shell=True)
-            else:
-                subprocess.run("del frame_*.ppm", shell=True)
-            print("Cleanup frame_*.ppm complete.")
-                
-        except subprocess.CalledProcessError:
-            print("ERROR: The 'convert' command failed.")
-            print("Make sure ImageMagick is installed correctly.")
-        except FileNotFoundError:
-            print("ERROR: Command not found. Is ImageMagick installed?")
+            filename, writer_class = "animation.gif", GifWriter
+
+        # Chaque frame est encodée dès qu'elle est rendue, sans fichier intermédiaire
+        if profiler is not None:
+            profiler.start_frame()
+        if workers != 1:
+            frames = render_animation_parallel(scene, args.scene, initial_centers, nb_frames, base_render, workers,
+                                               args.width, args.height)
+        else:
+            frames = (render_animation_frame(scene, args.scene, initial_centers, i, nb_frames, render,
+                                             args.width, args.height)
+                      for i in range(nb_frames))
+        with writer_class(filename, args.width, args.height) as writer:
+            for i, image in enumerate(frames):
+                writer.add_frame(image)
+                if profiler is not None:
+                    profiler.end_frame(f"frame {i + 1}/{nb_frames}")
+
+        print("Rendering complete.")
+        if profiler is not None:
+            profiler.uninstall()
+            profiler.save_trace(args.profile)
+        print("------------------------------------------------")
+        print(f"SUCCESS: Animation saved as '{filename}'")
+        print("------------------------------------------------")
 
-        
         if sys.platform.startswith('linux'):
-            commandRun = "eog animation.gif"
+            commandRun = f"eog {filename}"
         else:
-            commandRun = "start animation.gif"
-        print("Opening the GIF with eog...")
+            commandRun = f"start {filename}"
+        print("Opening the animation with eog...")
         try:
-            print("GIF opened successfully.")
+            print("Animation opened successfully.")
             subprocess.run(commandRun, shell=True, check=True)
         except subprocess.CalledProcessError:
-            print("ERROR: Could not open the GIF with eog.")
+            print("ERROR: Could not open the animation with eog.")
 
     else:
         print("Rendering single static frame...")
-        image = render_image(scene)
-        save_ppm(image, filename='output.ppm')
+        reset_render_stats()
+        if profiler is not None:
+            profiler.start_frame()
+        if args.progressive:
+            def save_preview(preview, step):
+                if step > 1:
+                    print(f"Preview pass 1/{step} ready")
+                    save_ppm(preview, filename='output.ppm', fmt=args.ppm_format)
+
+            image = render_progressive(scene, args.width, args.height, callback=save_preview, depth=args.depth,
+                                       fov=args.fov, roulette=args.roulette)
+        else:
+            image = render(scene, args.width, args.height)
+        save_ppm(image, args.width, args.height, filename='output.ppm', fmt=args.ppm_format)
+        report_render_stats()
+        if profiler is not None:
+            profiler.end_frame("output.ppm")
+            profiler.uninstall()
+            profiler.save_trace(args.profile)
         print("Single frame rendered.")
 
         print("Opening the image with eog...")